@@ -1,4 +1,5 @@
 import argparse
+import concurrent.futures
 import copy
 import getpass
 import os
@@ -10,7 +11,7 @@ from typing import List
 import rich.table
 import rich.text
 import rich.tree
-from requests import HTTPError
+from requests import HTTPError, RequestException
 from rich import box
 from rich_argparse import RichHelpFormatter
 
@@ -24,7 +25,18 @@ from md2cf.console_output import (
 )
 from md2cf.document import Page
 from md2cf.tui import Md2cfTUI
-from md2cf.upsert import upsert_attachment, upsert_page
+from md2cf.upsert import (
+    UpsertAction,
+    get_attachment_path,
+    get_existing_pages,
+    upsert_attachment,
+    upsert_page,
+)
+
+# The workers share the client's session, whose connection pool keeps up to
+# requests.adapters.DEFAULT_POOLSIZE (10) connections per host, so each worker
+# can keep its own connection alive
+MAX_ATTACHMENT_WORKERS = 8
 
 
 def get_parser():
@@ -344,11 +356,7 @@ def main():
 
     for page in pages_to_upload:
         for attachment in page.attachments:
-            if page.file_path is not None:
-                attachment_path = page.file_path.parent.joinpath(attachment)
-            else:
-                attachment_path = attachment
-
+            attachment_path = get_attachment_path(page, attachment)
             if not attachment_path.is_file():
                 error_console.log(
                     f"[bold red]:x: ERROR:[default] attachment {attachment_path} "
@@ -358,7 +366,7 @@ def main():
 
     preface_markup = ""
     if args.preface_markdown:
-        preface_markup = md2cf.document.parse_page([args.preface_markdown]).body
+        preface_markup = md2cf.document.parse_page(args.preface_markdown).body
     elif args.preface_file:
         # We don't use strip_header or remove_text_newlines here
         # since this is just a preface doc
@@ -368,7 +376,7 @@ def main():
 
     postface_markup = ""
     if args.postface_markdown:
-        postface_markup = md2cf.document.parse_page([args.postface_markdown]).body
+        postface_markup = md2cf.document.parse_page(args.postface_markdown).body
     elif args.postface_file:
         # We don't use strip_header or remove_text_newlines here
         # since this is just a postface doc
@@ -397,10 +405,14 @@ def main():
 
         for page in pages_to_upload:
             pre_process_page(page, args, postface_markup, preface_markup, space_info)
-            tui.start_item_task(page.original_title)
+
+        existing_pages = prefetch_existing_pages(args, confluence, pages_to_upload)
+
+        for page in pages_to_upload:
+            page_progress = tui.start_item_task(page.original_title)
             upsert_page_result = None
             try:
-                tui.set_item_progress_label(page.original_title, "Upserting")
+                tui.set_item_progress_label(page_progress, "Upserting")
                 final_page = None
                 if not args.dry_run:
                     upsert_page_result = upsert_page(
@@ -410,37 +422,21 @@ def main():
                         only_changed=args.only_changed,
                         replace_all_labels=args.replace_all_labels,
                         minor_edit=args.minor_edit,
+                        existing_pages=existing_pages,
                     )
                     final_page = upsert_page_result.response
                     minimal_output_console.log(confluence.get_url(final_page))
                     json_output_console.print_json(data=final_page, indent=None)
                 if page.attachments:
-                    tui.set_item_progress_label(
-                        page.original_title, "Processing attachments"
+                    tui.set_item_progress_label(page_progress, "Processing attachments")
+                    upsert_page_attachments(
+                        args,
+                        confluence,
+                        page,
+                        upsert_page_result,
+                        page_progress,
+                        tui,
                     )
-                    for attachment in page.attachments:
-                        attachment_identifier = f"{page.original_title} {attachment}"
-                        tui.start_item_task(attachment_identifier)
-                        if not args.dry_run:
-                            upsert_attachment_result = upsert_attachment(
-                                confluence=confluence,
-                                attachment=attachment,
-                                existing_page=final_page,
-                                message=args.message,
-                                only_changed=args.only_changed,
-                                page=page,
-                            )
-                            tui.set_item_finished_text_from_result(
-                                attachment_identifier, upsert_attachment_result
-                            )
-                        else:
-                            tui.set_item_finished_text(
-                                attachment_identifier, "[yellow]Skipped (dry run)"
-                            )
-                        tui.set_item_progress_label(attachment_identifier, "")
-                        tui.tick_item_progress(attachment_identifier)
-                        tui.tick_item_progress(page.original_title)
-                        tui.tick_global_progress()
                 if page.file_path is not None and args.enable_relative_links:
                     # Skip pages without a file_path
                     # (e.g. section pages representing directories)
@@ -458,23 +454,23 @@ def main():
                 error = "[red]ERROR:[default] {}".format(str(e))
                 something_went_wrong = True
 
-            tui.set_item_progress_label(page.original_title, "")
+            tui.set_item_progress_label(page_progress, "")
             if not args.dry_run:
                 if not something_went_wrong:
                     tui.set_item_finished_text_from_result(
-                        page.original_title, upsert_page_result
+                        page_progress, upsert_page_result
                     )
                 else:
                     tui.set_item_progress_label(
-                        page.original_title, "[red]:x: Error while uploading"
+                        page_progress, "[red]:x: Error while uploading"
                     )
             else:
                 tui.set_item_finished_text(
-                    page.original_title,
+                    page_progress,
                     rich.text.Text.from_markup("[yellow]Skipped (dry run)"),
                 )
 
-            tui.tick_item_progress(page.original_title)
+            tui.tick_item_progress(page_progress)
             tui.tick_global_progress()
 
             if something_went_wrong:
@@ -505,6 +501,66 @@ def main():
         sys.exit(1)
 
 
+def prefetch_existing_pages(args, confluence, pages_to_upload):
+    # Looking up pages in bulk is only an optimization: when there's nothing to
+    # gain or the search fails, upsert_page looks up each page on its own
+    if args.dry_run or sum(page.page_id is None for page in pages_to_upload) < 2:
+        return None
+
+    try:
+        return get_existing_pages(confluence, pages_to_upload)
+    except (RequestException, ValueError) as e:
+        if args.debug:
+            console.print_exception(show_locals=True)
+        error_console.log(
+            f":warning-emoji: Could not look up the existing pages in bulk ({e}), "
+            "looking them up one at a time instead"
+        )
+        return None
+
+
+def upsert_page_attachments(
+    args, confluence, page, upsert_page_result, page_progress, tui
+):
+    final_page = None
+    existing_attachments = dict()
+    if not args.dry_run:
+        final_page = upsert_page_result.response
+        # A page that was just created can't have any attachments yet
+        if upsert_page_result.action != UpsertAction.CREATED:
+            existing_attachments = confluence.get_attachments(final_page)
+
+    def process_attachment(attachment):
+        attachment_progress = tui.start_item_task(f"{page.original_title} {attachment}")
+        if not args.dry_run:
+            upsert_attachment_result = upsert_attachment(
+                confluence=confluence,
+                attachment=attachment,
+                existing_page=final_page,
+                message=args.message,
+                only_changed=args.only_changed,
+                page=page,
+                existing_attachments=existing_attachments,
+            )
+            tui.set_item_finished_text_from_result(
+                attachment_progress, upsert_attachment_result
+            )
+        else:
+            tui.set_item_finished_text(attachment_progress, "[yellow]Skipped (dry run)")
+        tui.set_item_progress_label(attachment_progress, "")
+        tui.tick_item_progress(attachment_progress)
+        tui.tick_item_progress(page_progress)
+        tui.tick_global_progress()
+
+    # Attachments are independent of each other and uploading them is mostly
+    # waiting on the network, so they can be processed concurrently
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=MAX_ATTACHMENT_WORKERS
+    ) as executor:
+        # Consuming the results re-raises the first exception, if any
+        list(executor.map(process_attachment, page.attachments))
+
+
 def pre_process_page(page, args, postface_markup, preface_markup, space_info):
     page.original_title = page.title
     page.space = args.space
@@ -617,9 +673,9 @@ def update_pages_with_relative_links(
             page_modified = True
 
         if page_modified:
-            tui.reset_item_task(page.original_title, total=1)
-            tui.set_item_progress_label(page.original_title, "Updating relative links")
-            tui.start_item_task(page.original_title)
+            page_progress = tui.start_item_task(page.original_title)
+            tui.reset_item_task(page_progress, total=1)
+            tui.set_item_progress_label(page_progress, "Updating relative links")
             if not args.dry_run:
                 try:
                     upsert_page(
@@ -636,7 +692,7 @@ def update_pages_with_relative_links(
 
                 if not something_went_wrong:
                     tui.set_item_finished_text(
-                        page.original_title,
+                        page_progress,
                         rich.text.Text.from_markup(
                             "[green]:heavy_check_mark-emoji: Updated "
                             "(updated relative links)"
@@ -644,19 +700,19 @@ def update_pages_with_relative_links(
                     )
                 else:
                     tui.set_item_progress_label(
-                        page.original_title,
+                        page_progress,
                         "[red]:x: Error while updating relative links",
                     )
             else:
                 tui.set_item_finished_text(
-                    page.original_title,
+                    page_progress,
                     rich.text.Text.from_markup(
                         "[yellow]Not updating relative links (dry run)"
                     ),
                 )
 
-            tui.set_item_progress_label(page.original_title, "")
-            tui.tick_item_progress(page.original_title)
+            tui.set_item_progress_label(page_progress, "")
+            tui.tick_item_progress(page_progress)
 
         if something_went_wrong:
             raise error
@@ -666,8 +722,8 @@ def collect_pages_to_upload(args):
     pages_to_upload: List[Page] = list()
     if not args.file_list:  # Uploading from standard input
         pages_to_upload.append(
-            md2cf.document.get_page_data_from_lines(
-                sys.stdin.readlines(),
+            md2cf.document.get_page_data_from_text(
+                sys.stdin.read(),
                 strip_header=args.strip_top_header,
                 remove_text_newlines=args.remove_text_newlines,
                 enable_relative_links=False,
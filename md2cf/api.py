@@ -1,12 +1,23 @@
+import io
 from urllib.parse import urljoin
 
 import requests
 import requests.adapters
 import requests.packages
+import requests.utils
 import urllib3
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary, encode_multipart_formdata
 
 
 def bunchify(obj):
+    """
+    Convert all the dictionaries in a JSON-like structure into Bunches, and all the
+    tuples into lists.
+
+    API responses don't go through this, they're converted while they're decoded by
+    _bunch_from_json_object.
+    """
     if isinstance(obj, (list, tuple)):
         return [bunchify(item) for item in obj]
     if isinstance(obj, dict):
@@ -15,15 +26,108 @@ def bunchify(obj):
 
 
 class Bunch(dict):
-    def __init__(self, kwargs=None):
-        if kwargs is None:
-            kwargs = {}
-        for key, value in kwargs.items():
-            kwargs[key] = bunchify(value)
+    def __init__(self, kwargs=()):
+        # Copy the caller's dictionary (or key/value pairs) first, so the values
+        # can be converted in place without changing it
         super(Bunch, self).__init__(kwargs)
+        for key, value in self.items():
+            self[key] = bunchify(value)
         self.__dict__ = self
 
 
+def _bunch_from_json_object(json_object):
+    """
+    Turn a dictionary decoded from JSON into a Bunch.
+
+    Used as the object_hook when decoding responses. The decoder calls it from the
+    innermost objects outwards, so the values have already been converted and
+    don't need to be walked again like bunchify would.
+    """
+    bunch = Bunch()
+    dict.update(bunch, json_object)
+    return bunch
+
+
+def cql_quote(value):
+    """Quote a value to be used as a string in a CQL query"""
+    escaped_value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped_value}"'
+
+
+class MultipartFileBody:
+    """
+    A multipart/form-data request body that streams a file from disk.
+
+    requests reads the whole file into memory and then copies it again into the
+    encoded body. This object is read in chunks as the request is sent instead, and
+    can be rewound so that retries still work.
+    """
+
+    def __init__(self, fp, comment=None):
+        boundary = choose_boundary()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        file_field = RequestField(
+            name="file", data=b"", filename=requests.utils.guess_filename(fp) or "file"
+        )
+        file_field.make_multipart()
+        self._head = f"--{boundary}\r\n{file_field.render_headers()}".encode()
+
+        fields = []
+        if comment:
+            # Matches what requests would send for a plain string in `files`
+            comment_field = RequestField(
+                name="comment", data=comment, filename="comment"
+            )
+            comment_field.make_multipart()
+            fields.append(comment_field)
+        self._tail = b"\r\n" + encode_multipart_formdata(fields, boundary)[0]
+
+        self._fp = fp
+        self._file_start = fp.tell()
+        self._file_size = fp.seek(0, io.SEEK_END) - self._file_start
+        self._file_end = len(self._head) + self._file_size
+        self._length = self._file_end + len(self._tail)
+        self._position = 0
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._position = max(offset, 0)
+        file_offset = min(max(self._position - len(self._head), 0), self._file_size)
+        self._fp.seek(self._file_start + file_offset)
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length - self._position
+
+        chunks = []
+        while size > 0 and self._position < self._length:
+            if self._position < len(self._head):
+                chunk = self._head[self._position : self._position + size]
+            elif self._position < self._file_end:
+                chunk = self._fp.read(min(size, self._file_end - self._position))
+                if not chunk:
+                    raise IOError("The file was truncated while being uploaded")
+            else:
+                tail_offset = self._position - self._file_end
+                chunk = self._tail[tail_offset : tail_offset + size]
+            chunks.append(chunk)
+            self._position += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+
 class MinimalConfluence:
     def __init__(
         self, host, username=None, password=None, token=None, verify=True, max_retries=4
@@ -53,7 +157,7 @@ class MinimalConfluence:
                 backoff_factor=1,
                 respect_retry_after_header=True,
                 allowed_methods=None,
-            )
+            ),
         )
         self.api.mount("http://", adapter)
         self.api.mount("https://", adapter)
@@ -66,7 +170,7 @@ class MinimalConfluence:
     def _request(self, method, path, **kwargs):
         r = self.api.request(method, urljoin(self.host, path), **kwargs)
         r.raise_for_status()
-        return bunchify(r.json())
+        return r.json(object_hook=_bunch_from_json_object)
 
     def _get(self, path, **kwargs):
         return self._request("GET", path, **kwargs)
@@ -77,6 +181,16 @@ class MinimalConfluence:
     def _put(self, path, **kwargs):
         return self._request("PUT", path, **kwargs)
 
+    def _get_all_results(self, path, **kwargs):
+        response = self._get(path, **kwargs)
+        yield from response.results
+        while "next" in response._links:
+            # The next link is relative to the base URL of the Confluence instance,
+            # and already contains all the original parameters
+            kwargs.pop("params", None)
+            response = self._get(response._links.base + response._links.next, **kwargs)
+            yield from response.results
+
     def get_page(
         self,
         title=None,
@@ -108,24 +222,62 @@ class MinimalConfluence:
         if page_id is not None:
             return self._get(f"content/{page_id}", params=params)
         elif title is not None:
-            params = {"title": title, "type": content_type}
+            params = {**(params or {}), "title": title, "type": content_type}
             if space_key is not None:
                 params["spaceKey"] = space_key
+            # The search results are expanded like a single page would be, so there's
+            # no need to fetch the page again by ID
             response = self._get("content", params=params)
             try:
-                # A search by title/space doesn't return full page objects,
-                # and since we don't support expansion in this implementation
-                # just yet, we just retrieve the "full" page data using the page
-                # ID for the first search result
-                return self.get_page(
-                    page_id=response.results[0].id,
-                    additional_expansions=additional_expansions,
-                )
+                return response.results[0]
             except IndexError:
                 return None
         else:
             raise ValueError("At least one of title or page_id must not be None")
 
+    def get_pages(
+        self,
+        titles,
+        space_key,
+        content_type="page",
+        additional_expansions=None,
+        batch_size=50,
+    ):
+        """
+        Find many pages in a space by title, with as few requests as possible
+
+        Args:
+            titles (list of str): the titles of the pages
+            space_key (str): the Confluence space for the pages
+            content_type (str): Content type. Default value: page.
+              Valid values: page, blogpost.
+            additional_expansions (list of str): Additional expansions that should be
+              made when calling the api
+            batch_size (int): how many titles to look for in a single search
+
+        Returns:
+            A dictionary of the pages that were found, by title. Search results can
+            lag behind recent changes, so a missing title doesn't guarantee that the
+            page doesn't exist.
+
+        """
+        titles = list(dict.fromkeys(titles))
+        pages = dict()
+        for batch_start in range(0, len(titles), batch_size):
+            batch = titles[batch_start : batch_start + batch_size]
+            cql = (
+                f"space = {cql_quote(space_key)} AND type = {cql_quote(content_type)} "
+                f"AND title in ({', '.join(cql_quote(title) for title in batch)})"
+            )
+            params = {"cql": cql, "limit": batch_size}
+            if additional_expansions is not None:
+                params["expand"] = ",".join(additional_expansions)
+            for page in self._get_all_results("content/search", params=params):
+                # CQL title matching isn't guaranteed to be exact
+                if page.title in batch:
+                    pages[page.title] = page
+        return pages
+
     def create_page(
         self,
         space,
@@ -222,21 +374,40 @@ class MinimalConfluence:
         if existing_attachments.size:
             return existing_attachments.results[0]
 
+    def get_attachments(self, confluence_page):
+        """
+        Get all the attachments of a page
+
+        Args:
+            confluence_page: the page, as returned by the API
+
+        Returns:
+            A dictionary of the attachments of the page, by file name
+
+        """
+        attachments = self._get_all_results(
+            f"content/{confluence_page.id}/child/attachment",
+            headers={"X-Atlassian-Token": "nocheck", "Accept": "application/json"},
+            params={"expand": "version", "limit": 200},
+        )
+        return {attachment.title: attachment for attachment in attachments}
+
     def update_attachment(self, confluence_page, fp, existing_attachment, message=""):
+        body = MultipartFileBody(fp, comment=message)
         return self._post(
             f"content/{confluence_page.id}/child/attachment/{existing_attachment.id}/"
             f"data",
-            headers={"X-Atlassian-Token": "nocheck"},
-            files={"file": fp, "comment": message if message else None},
+            headers={"X-Atlassian-Token": "nocheck", "Content-Type": body.content_type},
+            data=body,
         )
 
     def create_attachment(self, confluence_page, fp, message=""):
+        body = MultipartFileBody(fp, comment=message)
         return self._post(
             f"content/{confluence_page.id}/child/attachment",
-            json={"comment": message} if message else None,
-            headers={"X-Atlassian-Token": "nocheck"},
+            headers={"X-Atlassian-Token": "nocheck", "Content-Type": body.content_type},
             params={"allowDuplicated": "true"},
-            files={"file": fp, "comment": message if message else None},
+            data=body,
         )
 
     def add_labels(self, page, labels):
@@ -1,3 +1,5 @@
+import concurrent.futures
+import functools
 import hashlib
 import os
 from pathlib import Path
@@ -11,6 +13,28 @@ from yaml.parser import ParserError
 from md2cf.confluence_renderer import ConfluenceRenderer, RelativeLink
 from md2cf.ignored_files import GitRepository
 
+try:
+    # The libyaml-based loader is much faster, but it's only available if PyYAML
+    # was built against libyaml
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+PARALLEL_RENDERING_THRESHOLD = 64
+
+
+def new_content_hash(legacy: bool = False):
+    """
+    Create the hash object used to detect changes in pages and attachments.
+
+    :param legacy: Use SHA-1 instead of BLAKE2b, to check hashes written by
+      older versions of md2cf
+    :return: A hashlib hash object with a 40 character hex digest
+    """
+    if legacy:
+        return hashlib.sha1()
+    return hashlib.blake2b(digest_size=20)
+
 
 class Page(object):
     def __init__(
@@ -43,9 +67,22 @@ class Page(object):
         self.parent_title = parent_title
         self.space = space
         self.labels = labels
-
-    def get_content_hash(self):
-        return hashlib.sha1(self.body.encode()).hexdigest()
+        self._content_hash: Optional[str] = None
+        self._content_hash_body: Optional[str] = None
+
+    def get_content_hash(self, legacy: bool = False):
+        # The body can still change after the hash is computed (e.g. when adding a
+        # preface), so the cached hash is only valid for the exact same body
+        if not legacy and self._content_hash_body is self.body:
+            return self._content_hash
+
+        content_hash = new_content_hash(legacy=legacy)
+        content_hash.update(self.body.encode())
+        digest = content_hash.hexdigest()
+        if not legacy:
+            self._content_hash = digest
+            self._content_hash_body = self.body
+        return digest
 
     def __repr__(self):
         return "Page({})".format(
@@ -114,12 +151,21 @@ def get_pages_from_directory(
     folder_data = dict()
     git_repo = GitRepository(file_path, use_gitignore=use_gitignore)
 
+    # Walk the tree first so all the markdown files can be rendered in one go
+    walked_folders = list()
     for current_path, directories, file_names in os.walk(file_path):
         current_path = Path(current_path).resolve()
 
         if git_repo.is_ignored(current_path):
             continue
 
+        # Don't descend into ignored directories at all
+        directories[:] = [
+            directory
+            for directory in directories
+            if not git_repo.is_ignored(current_path.joinpath(directory))
+        ]
+
         markdown_files = [
             Path(current_path, file_name)
             for file_name in file_names
@@ -129,7 +175,20 @@ def get_pages_from_directory(
         markdown_files = [
             path for path in markdown_files if not git_repo.is_ignored(path)
         ]
+        walked_folders.append((current_path, directories, file_names, markdown_files))
+
+    rendered_pages = render_pages_from_file_paths(
+        [
+            markdown_file
+            for _, _, _, markdown_files in walked_folders
+            for markdown_file in markdown_files
+        ],
+        strip_header=strip_header,
+        remove_text_newlines=remove_text_newlines,
+        enable_relative_links=enable_relative_links,
+    )
 
+    for current_path, directories, file_names, markdown_files in walked_folders:
         folder_data[current_path] = {"n_files": len(markdown_files)}
 
         # we'll capture title and path of the parent folder for this folder:
@@ -169,7 +228,7 @@ def get_pages_from_directory(
                 folder_title = parent_page_title
         if use_pages_file and ".pages" in file_names:
             with open(current_path.joinpath(".pages")) as pages_fp:
-                pages_file_contents = yaml.safe_load(pages_fp)
+                pages_file_contents = yaml.load(pages_fp, Loader=SafeLoader)
             if "title" in pages_file_contents:
                 parent_page_title = pages_file_contents["title"]
                 folder_title = parent_page_title
@@ -188,12 +247,7 @@ def get_pages_from_directory(
             )
 
         for markdown_file in markdown_files:
-            processed_page = get_page_data_from_file_path(
-                markdown_file,
-                strip_header=strip_header,
-                remove_text_newlines=remove_text_newlines,
-                enable_relative_links=enable_relative_links,
-            )
+            processed_page = rendered_pages[markdown_file]
             processed_page.parent_title = parent_page_title
             processed_pages.append(processed_page)
 
@@ -206,6 +260,40 @@ def get_pages_from_directory(
     return processed_pages
 
 
+def render_pages_from_file_paths(
+    file_paths: List[Path],
+    strip_header: bool = False,
+    remove_text_newlines: bool = False,
+    enable_relative_links: bool = False,
+) -> Dict[Path, Page]:
+    """
+    Render a list of markdown files, spreading the work across multiple processes
+    when there are enough files to make it worthwhile.
+
+    :param file_paths: The markdown files to render
+    :param strip_header:
+    :param remove_text_newlines:
+    :param enable_relative_links:
+    :return: A dictionary mapping each file path to its rendered page
+    """
+    render_page = functools.partial(
+        get_page_data_from_file_path,
+        strip_header=strip_header,
+        remove_text_newlines=remove_text_newlines,
+        enable_relative_links=enable_relative_links,
+    )
+
+    # Starting up the worker processes has a cost, so small trees are cheaper to
+    # render in the current process
+    if len(file_paths) < PARALLEL_RENDERING_THRESHOLD or (os.cpu_count() or 1) < 2:
+        pages = map(render_page, file_paths)
+        return dict(zip(file_paths, pages))
+
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        pages = executor.map(render_page, file_paths, chunksize=16)
+        return dict(zip(file_paths, pages))
+
+
 def get_page_data_from_file_path(
     file_path: Path,
     strip_header: bool = False,
@@ -217,15 +305,15 @@ def get_page_data_from_file_path(
 
     try:
         with open(file_path) as file_handle:
-            markdown_lines = file_handle.readlines()
+            markdown = file_handle.read()
     except UnicodeDecodeError:
         with open(file_path, "rb") as file_handle:
             detected_encoding = chardet.detect(file_handle.read())
         with open(file_path, encoding=detected_encoding["encoding"]) as file_handle:
-            markdown_lines = file_handle.readlines()
+            markdown = file_handle.read()
 
-    page = get_page_data_from_lines(
-        markdown_lines,
+    page = get_page_data_from_text(
+        markdown,
         strip_header=strip_header,
         remove_text_newlines=remove_text_newlines,
         enable_relative_links=enable_relative_links,
@@ -239,18 +327,18 @@ def get_page_data_from_file_path(
     return page
 
 
-def get_page_data_from_lines(
-    markdown_lines: List[str],
+def get_page_data_from_text(
+    markdown: str,
     strip_header: bool = False,
     remove_text_newlines: bool = False,
     enable_relative_links: bool = False,
 ) -> Page:
-    frontmatter = get_document_frontmatter(markdown_lines)
-    if "frontmatter_end_line" in frontmatter:
-        markdown_lines = markdown_lines[frontmatter["frontmatter_end_line"] :]
+    frontmatter = get_document_frontmatter(markdown)
+    if "frontmatter_end" in frontmatter:
+        markdown = markdown[frontmatter["frontmatter_end"] :]
 
     page = parse_page(
-        markdown_lines,
+        markdown,
         strip_header=strip_header,
         remove_text_newlines=remove_text_newlines,
         enable_relative_links=enable_relative_links,
@@ -269,11 +357,32 @@ def get_page_data_from_lines(
     return page
 
 
-def parse_page(
+def get_page_data_from_lines(
     markdown_lines: List[str],
     strip_header: bool = False,
     remove_text_newlines: bool = False,
     enable_relative_links: bool = False,
+) -> Page:
+    """
+    Kept for code that still reads markdown files into a list of lines, use
+    get_page_data_from_text instead.
+
+    :param markdown_lines: The lines of the markdown document, with their newlines
+    :return: The parsed page
+    """
+    return get_page_data_from_text(
+        "".join(markdown_lines),
+        strip_header=strip_header,
+        remove_text_newlines=remove_text_newlines,
+        enable_relative_links=enable_relative_links,
+    )
+
+
+def parse_page(
+    markdown: str,
+    strip_header: bool = False,
+    remove_text_newlines: bool = False,
+    enable_relative_links: bool = False,
 ) -> Page:
     renderer = ConfluenceRenderer(
         use_xhtml=True,
@@ -282,7 +391,7 @@ def parse_page(
         enable_relative_links=enable_relative_links,
     )
     confluence_mistune = mistune.Markdown(renderer=renderer)
-    confluence_content = confluence_mistune("".join(markdown_lines))
+    confluence_content = confluence_mistune(markdown)
 
     page = Page(
         title=renderer.title,
@@ -294,24 +403,23 @@ def parse_page(
     return page
 
 
-def get_document_frontmatter(markdown_lines: List[str]) -> Dict[str, Any]:
+def get_document_frontmatter(markdown: str) -> Dict[str, Any]:
     frontmatter_yaml = ""
-    frontmatter_end_line = 0
-    if markdown_lines and markdown_lines[0] == "---\n":
-        for index, line in enumerate(markdown_lines[1:]):
-            if line == "---\n":
-                frontmatter_end_line = index + 2
-                break
-            else:
-                frontmatter_yaml += line
+    frontmatter_end = 0
+    if markdown.startswith("---\n"):
+        # Searching from the first newline also catches an empty frontmatter block
+        closing_fence = markdown.find("\n---\n", 3)
+        if closing_fence != -1:
+            frontmatter_yaml = markdown[4 : closing_fence + 1]
+            frontmatter_end = closing_fence + 5
     frontmatter = None
-    if frontmatter_yaml and frontmatter_end_line:
+    if frontmatter_yaml and frontmatter_end:
         try:
-            frontmatter = yaml.safe_load(frontmatter_yaml)
+            frontmatter = yaml.load(frontmatter_yaml, Loader=SafeLoader)
         except ParserError:
             pass
     if isinstance(frontmatter, dict):
-        frontmatter["frontmatter_end_line"] = frontmatter_end_line
+        frontmatter["frontmatter_end"] = frontmatter_end
     else:
         frontmatter = {}
 
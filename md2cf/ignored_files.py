@@ -1,14 +1,36 @@
 """
 Allow checking files for ignored status in gitignore files in the repo.
 """
+import functools
+import os
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional
 
 import gitignorefile
 
 from md2cf.console_output import error_console
 
 
+@functools.lru_cache(maxsize=None)
+def _find_git_root(start_path: str) -> Optional[str]:
+    """
+    Find the closest parent of start_path that contains a .git directory. The
+    result is cached, so scanning several directories in the same repository only
+    searches the filesystem once.
+
+    :param start_path: An absolute path to a file or directory
+    :return: The root directory of the git repo, or None if there isn't one
+    """
+    p = start_path
+    if os.path.isfile(p):
+        p = os.path.dirname(p)
+    while p != os.path.dirname(p):
+        if os.path.isdir(os.path.join(p, ".git")):
+            return p
+        p = os.path.dirname(p)
+    return None
+
+
 class GitRepository:
     """
     Represents a Git repository by finding the .git folder at the root
@@ -23,6 +45,9 @@ class GitRepository:
     def __init__(self, repo_path: Path, use_gitignore=True):
         self.use_gitignore = use_gitignore
         self.root_dir = self._find_root_dir(repo_path) if use_gitignore else None
+        self._root_dir_str = str(self.root_dir) if self.root_dir is not None else None
+        self._directory_gitignores: Dict[str, List[str]] = dict()
+        self._gitignore_matchers: Dict[str, Callable[[str], bool]] = dict()
 
     @staticmethod
     def _find_root_dir(start_path: Path):
@@ -31,20 +56,14 @@ class GitRepository:
         :param start_path: A file or directory path to start searching from
         :return: The root directory of the git repo.
         """
-        fs_root = Path("/")
-        p = start_path.absolute()
-        if p.is_file():
-            p = p.parent
-        while p != fs_root:
-            git_dir = p.joinpath(".git")
-            if git_dir.exists() and git_dir.is_dir():
-                return p
-            p = p.parent
-        error_console.log(
-            f":warning-emoji: Directory {start_path} is not part of a git "
-            f"repository: gitignore checking disabled."
-        )
-        return None
+        root_dir = _find_git_root(os.path.abspath(start_path))
+        if root_dir is None:
+            error_console.log(
+                f":warning-emoji: Directory {start_path} is not part of a git "
+                f"repository: gitignore checking disabled."
+            )
+            return None
+        return Path(root_dir)
 
     def collect_gitignores(self, filepath: Path) -> List[Path]:
         """
@@ -55,23 +74,77 @@ class GitRepository:
         :param filepath: The path to start searching for .gitignore files
         :return: List of paths to .gitignore files relevant for start_path
         """
-        fs_root = Path("/")
-        ret = list()
-
-        p = filepath.absolute()
-        if p.is_file():
-            p = p.parent
-        while p != fs_root:
-            gitignore_file = p.joinpath(".gitignore")
-            if gitignore_file.exists() and gitignore_file.is_file():
-                ret.append(gitignore_file)
-            if p == self.root_dir:
-                return ret
-            p = p.parent
-
-        # if not .git directory found, we're not in a git repo and gitignore files
-        # cannot be trusted.
-        return list()
+        return [Path(g) for g in self._collect_gitignore_paths(filepath)]
+
+    def _collect_gitignore_paths(self, filepath: Path) -> List[str]:
+        """
+        Same as collect_gitignores, but works on plain strings with os.path to
+        avoid creating intermediate Path objects for every parent directory.
+        """
+        p = os.path.abspath(filepath)
+        if os.path.isfile(p):
+            p = os.path.dirname(p)
+        return self._directory_gitignore_paths(p)
+
+    def _directory_gitignore_paths(self, directory: str) -> List[str]:
+        """
+        Return the .gitignore files that apply to a directory, from the closest one
+        to the one at the git root. The result is cached for the directory and for
+        all the parents that had to be walked to find it, so files in the same
+        directory or in sibling directories share a single walk.
+
+        :param directory: The absolute path to the directory
+        :return: List of paths to .gitignore files, which must not be modified
+        """
+        walked_directories = list()
+        p = directory
+        while p not in self._directory_gitignores:
+            if p == os.path.dirname(p):
+                # if not .git directory found, we're not in a git repo and gitignore
+                # files cannot be trusted.
+                for walked_directory in walked_directories:
+                    self._directory_gitignores[walked_directory] = list()
+                return list()
+            walked_directories.append(p)
+            if p == self._root_dir_str:
+                break
+            p = os.path.dirname(p)
+
+        gitignores = self._directory_gitignores.get(p, list())
+        for walked_directory in reversed(walked_directories):
+            gitignore_file = self._gitignore_in(walked_directory)
+            if gitignore_file is not None:
+                gitignores = [gitignore_file] + gitignores
+            self._directory_gitignores[walked_directory] = gitignores
+        return gitignores
+
+    @staticmethod
+    def _gitignore_in(directory: str) -> Optional[str]:
+        """
+        Return the path to the .gitignore file in directory, if there is one.
+
+        :param directory: The absolute path to the directory
+        :return: The path to the .gitignore file, or None
+        """
+        gitignore_file = os.path.join(directory, ".gitignore")
+        if not os.path.isfile(gitignore_file):
+            return None
+        return gitignore_file
+
+    def _gitignore_matcher(self, gitignore_file: str) -> Callable[[str], bool]:
+        """
+        Parse a .gitignore file, or return the matcher it was already parsed into.
+        Every file in the directory and its subdirectories is checked against it.
+
+        :param gitignore_file: The path to the .gitignore file
+        :return: A function that tells whether a path is ignored by the file
+        """
+        try:
+            return self._gitignore_matchers[gitignore_file]
+        except KeyError:
+            matcher = gitignorefile.parse(gitignore_file)
+            self._gitignore_matchers[gitignore_file] = matcher
+            return matcher
 
     def is_ignored(self, filepath: Path) -> bool:
         """
@@ -85,6 +158,7 @@ class GitRepository:
             return False
         if self.root_dir is None:
             return False
-        gitignores = self.collect_gitignores(filepath)
-        matchers = [gitignorefile.parse(str(g)) for g in gitignores]
-        return any([m(str(filepath)) for m in matchers])
+        gitignores = self._collect_gitignore_paths(filepath)
+        filepath = str(filepath)
+        # Stop parsing and checking gitignore files as soon as one matches
+        return any(self._gitignore_matcher(g)(filepath) for g in gitignores)
@@ -9,28 +9,49 @@ import rich.tree
 from md2cf.console_output import console
 
 
+class LazyProgress(object):
+    """
+    Placeholder for the progress bar of a single item, which only gets built when
+    the item is first worked on. Until then it renders as an empty line.
+    """
+
+    def __init__(self, total, finished_text=""):
+        self.total = total
+        self.finished_text = finished_text
+        self._progress = None
+
+    @property
+    def progress(self) -> rich.progress.Progress:
+        if self._progress is None:
+            self._progress = rich.progress.Progress(
+                rich.progress.BarColumn(),
+                rich.progress.SpinnerColumn(finished_text=self.finished_text),
+                rich.progress.TextColumn(""),
+                console=console,
+            )
+            self._progress.add_task(description="", total=self.total, start=False)
+        return self._progress
+
+    def __rich__(self):
+        if self._progress is None:
+            return ""
+        return self._progress
+
+
 class Md2cfTUI(object):
     def __init__(self, pages_to_upload):
         tree = rich.tree.Tree("Pages to upload", hide_root=True)
         progress_table = rich.table.Table.grid()
         progress_table.row_styles = ["dim", ""]
         title_to_tree: Dict[str, rich.tree.Tree] = dict()
-        self.title_to_progress: Dict[str, rich.progress.Progress] = dict()
+        self.title_to_progress: Dict[str, LazyProgress] = dict()
         for page in pages_to_upload:
             if page.file_path is None and len(pages_to_upload) > 1:
                 pretty_title = f":open_file_folder: {page.title}"
             else:
                 pretty_title = f":page_facing_up: {page.title}"
 
-            page_progress = rich.progress.Progress(
-                rich.progress.BarColumn(),
-                rich.progress.SpinnerColumn(finished_text=""),
-                rich.progress.TextColumn(""),
-                console=console,
-            )
-            page_progress.add_task(
-                description="", total=1 + len(page.attachments), start=False
-            )
+            page_progress = LazyProgress(total=1 + len(page.attachments))
             self.title_to_progress[page.title] = page_progress
 
             if page.parent_title:
@@ -48,13 +69,7 @@ class Md2cfTUI(object):
 
             for attachment in page.attachments:
                 page_node.add(f":paperclip: {attachment}", style="dim")
-                attachment_progress = rich.progress.Progress(
-                    rich.progress.BarColumn(),
-                    rich.progress.SpinnerColumn(finished_text="done"),
-                    rich.progress.TextColumn(""),
-                    console=console,
-                )
-                attachment_progress.add_task(description="", total=1, start=False)
+                attachment_progress = LazyProgress(total=1, finished_text="done")
                 progress_table.add_row(attachment_progress)
                 self.title_to_progress[
                     f"{page.title} {attachment}"
@@ -87,36 +102,44 @@ class Md2cfTUI(object):
     ):
         self.live.__exit__(*args, **kwargs)
 
-    def set_item_progress_label(self, item_name, label):
-        self.title_to_progress[item_name].columns[2].text_format = label
+    def set_item_progress_label(self, item_progress: LazyProgress, label):
+        item_progress.progress.columns[2].text_format = label
 
-    def set_item_finished_text(self, item_name, finished_text):
-        self.title_to_progress[item_name].columns[1].finished_text = finished_text
+    def set_item_finished_text(self, item_progress: LazyProgress, finished_text):
+        item_progress.progress.columns[1].finished_text = finished_text
 
-    def set_item_finished_text_from_result(self, item_name, upsert_result):
+    def set_item_finished_text_from_result(
+        self, item_progress: LazyProgress, upsert_result
+    ):
         self.set_item_finished_text(
-            item_name, Md2cfTUI.format_upsert_result(upsert_result)
+            item_progress, Md2cfTUI.format_upsert_result(upsert_result)
         )
 
-    def tick_item_progress(self, item_name):
-        task_for_this_item = self.title_to_progress[item_name].task_ids[0]
-        self.title_to_progress[item_name].update(
-            task_id=task_for_this_item,
-            advance=1,
-        )
+    def tick_item_progress(self, item_progress: LazyProgress):
+        progress = item_progress.progress
+        progress.update(task_id=progress.task_ids[0], advance=1)
 
     def tick_global_progress(self):
         self.overall_progress.update(
             task_id=self.overall_progress.task_ids[0], advance=1
         )
 
-    def start_item_task(self, item_name):
-        task_for_this_item = self.title_to_progress[item_name].task_ids[0]
-        self.title_to_progress[item_name].start_task(task_id=task_for_this_item)
-
-    def reset_item_task(self, item_name, total):
-        task_for_this_item = self.title_to_progress[item_name].task_ids[0]
-        self.title_to_progress[item_name].reset(task_id=task_for_this_item, total=total)
+    def start_item_task(self, item_name) -> LazyProgress:
+        """
+        Start the progress bar for an item.
+
+        :param item_name: The title of a page, or the title of a page followed by
+          the attachment name for attachments
+        :return: The progress bar for the item, to be passed to the other methods
+        """
+        item_progress = self.title_to_progress[item_name]
+        progress = item_progress.progress
+        progress.start_task(task_id=progress.task_ids[0])
+        return item_progress
+
+    def reset_item_task(self, item_progress: LazyProgress, total):
+        progress = item_progress.progress
+        progress.reset(task_id=progress.task_ids[0], total=total)
 
     @staticmethod
     def format_upsert_result(upsert_item_result):
@@ -1,13 +1,22 @@
+import functools
 import hashlib
 import re
+from collections import defaultdict
 from enum import Enum
 from pathlib import Path
-from typing import NamedTuple
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
 
 import md2cf.document
 from md2cf import api
 
-CONTENT_HASH_REGEX = re.compile(r"\[v([a-f0-9]{40})]$")
+# Hashes are BLAKE2b, marked with a "b". Unmarked hashes are SHA-1 hashes written
+# by older versions of md2cf.
+CONTENT_HASH_REGEX = re.compile(r"\[v(b?)([a-f0-9]{40})]$")
+HEX_DIGITS = "0123456789abcdef"
+FILE_HASH_BUFFER_SIZE = 1024 * 1024
+# Tuples, so that they can be shared between calls without being modified
+PAGE_EXPANSIONS = ("space", "ancestors", "history", "version", "metadata.labels")
+PARENT_PAGE_EXPANSIONS = ("space", "history", "version", "metadata.labels")
 
 
 class UpsertAction(Enum):
@@ -21,31 +30,153 @@ class UpsertResult(NamedTuple):
     response: api.Bunch
 
 
-# Adapted from https://stackoverflow.com/a/3431838
-def get_file_sha1(file_path: Path):
-    hash_sha1 = hashlib.sha1()
+class ContentHash(NamedTuple):
+    digest: str
+    legacy: bool
+
+
+def get_content_hash_from_message(message: str) -> Optional[ContentHash]:
+    """
+    Find the content hash at the end of a version message.
+
+    :param message: The version message of a page or attachment
+    :return: The hash, or None if the message doesn't end with one
+    """
+    # The hash is always the last thing in messages written by md2cf, so it can be
+    # checked directly without running the regular expression
+    if message.endswith("]"):
+        digest = message[-41:-1]
+        if len(digest) == 40 and not digest.strip(HEX_DIGITS):
+            if message[-44:-41] == "[vb":
+                return ContentHash(digest=digest, legacy=False)
+            if message[-43:-41] == "[v":
+                return ContentHash(digest=digest, legacy=True)
+
+    # The longest tag is "[vb" + 40 hex digits + "]", and $ also matches before a
+    # trailing newline, so there's no need to scan the rest of the message
+    content_hash_match = CONTENT_HASH_REGEX.search(message, max(len(message) - 45, 0))
+    if content_hash_match is None:
+        return None
+    return ContentHash(
+        digest=content_hash_match.group(2), legacy=not content_hash_match.group(1)
+    )
+
+
+def tag_message_with_hash(message: str, digest: str) -> str:
+    """
+    Add a content hash to the end of a version message.
+
+    :param message: The version message given by the user
+    :param digest: The hex digest of the page or attachment
+    :return: The tagged version message
+    """
+    return f"{message} [vb{digest}]" if message else f"[vb{digest}]"
+
+
+def get_file_hash(file_path: Path, legacy: bool = False):
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha1.update(chunk)
-    return hash_sha1.hexdigest()
+        return get_file_object_hash(f, legacy=legacy)
+
+
+def get_file_object_hash(f: BinaryIO, legacy: bool = False):
+    """
+    Hash the contents of a file that is already open, from its current position
+    to the end.
+
+    :param f: A file object opened in binary mode
+    :param legacy: Compute a legacy SHA-1 hash instead of a BLAKE2b hash
+    :return: The hex digest of the file contents
+    """
+    if hasattr(hashlib, "file_digest"):
+        # Python 3.11+ reads and hashes the whole file in C
+        return hashlib.file_digest(
+            f, functools.partial(md2cf.document.new_content_hash, legacy=legacy)
+        ).hexdigest()
+
+    # Reuse a single large buffer to avoid allocating a new bytes object for
+    # every chunk
+    file_hash = md2cf.document.new_content_hash(legacy=legacy)
+    buffer = bytearray(FILE_HASH_BUFFER_SIZE)
+    buffer_view = memoryview(buffer)
+    while True:
+        bytes_read = f.readinto(buffer)
+        if not bytes_read:
+            break
+        file_hash.update(buffer_view[:bytes_read])
+    return file_hash.hexdigest()
+
+
+def get_attachment_path(page: md2cf.document.Page, attachment):
+    if page.file_path is not None:
+        return page.file_path.parent.joinpath(attachment)
+    return attachment
+
+
+def get_existing_pages(
+    confluence: api.MinimalConfluence, pages: List[md2cf.document.Page]
+) -> Dict[Tuple[str, str, str], api.Bunch]:
+    """
+    Look up the pages that already exist on Confluence in bulk, instead of with one
+    request per page in upsert_page.
+
+    :param confluence: The Confluence API client
+    :param pages: The pages that are about to be uploaded
+    :return: The existing pages that were found, by (space, content type, title), to
+      be passed to upsert_page
+    """
+    titles_by_location = defaultdict(list)
+    for page in pages:
+        if page.page_id is None:
+            titles_by_location[(page.space, page.content_type)].append(page.title)
+
+    existing_pages = dict()
+    for (space, content_type), titles in titles_by_location.items():
+        pages_found = confluence.get_pages(
+            titles=titles,
+            space_key=space,
+            content_type=content_type,
+            additional_expansions=PAGE_EXPANSIONS,
+        )
+        # Titles are only unique within a space and content type
+        for title, existing_page in pages_found.items():
+            existing_pages[(space, content_type, title)] = existing_page
+    return existing_pages
+
 
+def get_parent_id_from_title(confluence, page, existing_pages=None):
+    # Only pages can be parents, and they're in the same space as their children
+    parent_key = (page.space, "page", page.parent_title)
+    if existing_pages is not None and parent_key in existing_pages:
+        return existing_pages[parent_key].id
 
-def get_parent_id_from_title(confluence, page):
     parent_page = confluence.get_page(
         title=page.parent_title,
         space_key=page.space,
-        additional_expansions=[
-            "space",
-            "history",
-            "version",
-            "metadata.labels",
-        ],
+        additional_expansions=PARENT_PAGE_EXPANSIONS,
     )
     if parent_page is None:
         raise KeyError("The parent page could not be found")
     return parent_page.id
 
 
+def get_page_message(page: md2cf.document.Page, message: str, only_changed: bool):
+    """
+    Build the version message for a page, tagged with its content hash if
+    only_changed is set.
+
+    This is only called right before the page is written, so the hash of pages
+    that turn out not to need an update is only computed when comparing it.
+
+    :param page: The page being uploaded
+    :param message: The version message given by the user
+    :param only_changed: Whether the content hash should be added to the message
+    :return: The version message
+    """
+    if not only_changed:
+        return message
+    return tag_message_with_hash(message, page.get_content_hash())
+
+
 def upsert_page(
     confluence: api.MinimalConfluence,
     message: str,
@@ -53,33 +184,25 @@ def upsert_page(
     only_changed: bool = False,
     replace_all_labels: bool = False,
     minor_edit: bool = False,
+    existing_pages: Optional[Dict[Tuple[str, str, str], api.Bunch]] = None,
 ):
-    existing_page = confluence.get_page(
-        title=page.title,
-        space_key=page.space,
-        page_id=page.page_id,
-        content_type=page.content_type,
-        additional_expansions=[
-            "space",
-            "ancestors",
-            "history",
-            "version",
-            "metadata.labels",
-        ],
-    )
+    existing_page = None
+    if existing_pages is not None and page.page_id is None:
+        existing_page = existing_pages.get((page.space, page.content_type, page.title))
+    if existing_page is None:
+        existing_page = confluence.get_page(
+            title=page.title,
+            space_key=page.space,
+            page_id=page.page_id,
+            content_type=page.content_type,
+            additional_expansions=PAGE_EXPANSIONS,
+        )
 
     # It's not mandatory to have a parent ID -- if there isn't one, the page will be a
     # top-level page in the Confluence space
     if page.parent_id is None:
         if page.parent_title is not None:
-            page.parent_id = get_parent_id_from_title(confluence, page)
-
-    page_message = message
-    if only_changed:
-        page_hash = page.get_content_hash()
-        page_message = (
-            f"{page_message} [v{page_hash}]" if page_message else f"[v{page_hash}]"
-        )
+            page.parent_id = get_parent_id_from_title(confluence, page, existing_pages)
 
     action = None
     if existing_page is None:
@@ -89,11 +212,20 @@ def upsert_page(
             body=page.body,
             content_type=page.content_type,
             parent_id=page.parent_id,
-            update_message=page_message,
+            update_message=get_page_message(page, message, only_changed),
             labels=page.labels,
         )
         action = UpsertAction.CREATED
     else:
+        # Labels are only replaced together with the rest of the page, so this is
+        # checked on the page as it was fetched, which has its labels expanded.
+        # The page returned by update_page doesn't.
+        labels_need_adding = (
+            not replace_all_labels
+            and page.labels
+            and labels_need_updating(page, existing_page)
+        )
+
         if not only_changed or page_needs_updating(
             page, existing_page, replace_all_labels
         ):
@@ -101,7 +233,7 @@ def upsert_page(
                 page=existing_page,
                 body=page.body,
                 parent_id=page.parent_id,
-                update_message=page_message,
+                update_message=get_page_message(page, message, only_changed),
                 labels=page.labels if replace_all_labels else None,
                 minor_edit=minor_edit,
             )
@@ -109,14 +241,18 @@ def upsert_page(
         else:
             action = UpsertAction.SKIPPED
 
-        if (
-            not replace_all_labels
-            and page.labels
-            and labels_need_updating(page, existing_page)
-        ):
+        if labels_need_adding:
             # print(f"Adding labels to page: {page.title} {page.labels}")
             confluence.add_labels(page=existing_page, labels=page.labels)
 
+        if existing_pages is not None and (
+            action == UpsertAction.UPDATED or labels_need_adding
+        ):
+            # The prefetched copy of the page is outdated now. Another page with the
+            # same title would otherwise be compared against it and updated with a
+            # stale version number
+            existing_pages.pop((page.space, page.content_type, page.title), None)
+
     return UpsertResult(action=action, response=existing_page)
 
 
@@ -124,10 +260,12 @@ def labels_need_updating(page, existing_page):
     if page.labels is None:
         return False
 
-    if sorted(
-        [label.name for label in existing_page.metadata.labels.results]
-    ) != sorted(page.labels):
+    labels = set(page.labels)
+    existing_labels = existing_page.metadata.labels.results
+    # Confluence labels are unique, so a different count means different labels
+    if len(existing_labels) != len(labels):
         return True
+    return {label.name for label in existing_labels} != labels
 
 
 def page_needs_updating(page, existing_page, replace_all_labels):
@@ -147,64 +285,78 @@ def page_needs_updating(page, existing_page, replace_all_labels):
         # print(f"Page labels have changed: {page.title} {page.labels}")
         return True
     else:
-        existing_page_hash_match = CONTENT_HASH_REGEX.search(
+        original_page_hash = get_content_hash_from_message(
             existing_page.version.message
         )
-        if existing_page_hash_match is not None:
-            original_page_hash = existing_page_hash_match.group(1)
-            if original_page_hash == page.get_content_hash():
+        if original_page_hash is not None:
+            if original_page_hash.digest == page.get_content_hash(
+                legacy=original_page_hash.legacy
+            ):
                 return False
 
     return True
 
 
 def upsert_attachment(
-    confluence, attachment, existing_page, message, only_changed, page
+    confluence,
+    attachment,
+    existing_page,
+    message,
+    only_changed,
+    page,
+    existing_attachments: Optional[Dict[str, api.Bunch]] = None,
 ):
-    if page.file_path is not None:
-        attachment_path = page.file_path.parent.joinpath(attachment)
-    else:
-        attachment_path = attachment
-
-    attachment_message = message
-    if only_changed:
-        new_attachment_hash = get_file_sha1(attachment_path)
-        attachment_message = (
-            f"{attachment_message} [v{new_attachment_hash}]"
-            if attachment_message
-            else f"[v{new_attachment_hash}]"
-        )
+    attachment_path = get_attachment_path(page, attachment)
 
-    existing_attachment = confluence.get_attachment(existing_page, attachment_path.name)
-
-    action = None
-    if existing_attachment is None:
-        # print(f"Uploading file: {attachment_path}")
-        action = UpsertAction.CREATED
-        with attachment_path.open("rb") as fp:
-            existing_attachment = confluence.create_attachment(
-                confluence_page=existing_page, fp=fp, message=attachment_message
+    # The same file object is used for hashing and uploading, rewinding it in
+    # between, so the attachment is only opened once
+    with attachment_path.open("rb") as fp:
+        if existing_attachments is not None:
+            existing_attachment = existing_attachments.get(attachment_path.name)
+        else:
+            existing_attachment = confluence.get_attachment(
+                existing_page, attachment_path.name
             )
-    else:
-        should_update = True
-        if only_changed:
-            existing_attachment_hash_match = CONTENT_HASH_REGEX.search(
+
+        new_attachment_hash = None
+        if existing_attachment is not None and only_changed:
+            original_attachment_hash = get_content_hash_from_message(
                 existing_attachment.version.message
             )
-            if existing_attachment_hash_match is not None:
-                original_attachment_hash = existing_attachment_hash_match.group(1)
-                if original_attachment_hash == new_attachment_hash:
-                    should_update = False
-                    action = UpsertAction.SKIPPED
-
-        if should_update:
-            with attachment_path.open("rb") as fp:
-                existing_attachment = confluence.update_attachment(
-                    confluence_page=existing_page,
-                    fp=fp,
-                    existing_attachment=existing_attachment,
-                    message=attachment_message,
+            if original_attachment_hash is not None:
+                # Only compute the kind of hash the existing attachment was tagged
+                # with, so unchanged attachments are hashed exactly once
+                current_attachment_hash = get_file_object_hash(
+                    fp, legacy=original_attachment_hash.legacy
                 )
+                if original_attachment_hash.digest == current_attachment_hash:
+                    return UpsertResult(
+                        action=UpsertAction.SKIPPED, response=existing_attachment
+                    )
+                if not original_attachment_hash.legacy:
+                    new_attachment_hash = current_attachment_hash
+
+        attachment_message = message
+        if only_changed:
+            if new_attachment_hash is None:
+                fp.seek(0)
+                new_attachment_hash = get_file_object_hash(fp)
+            attachment_message = tag_message_with_hash(message, new_attachment_hash)
+
+        fp.seek(0)
+        if existing_attachment is None:
+            # print(f"Uploading file: {attachment_path}")
+            action = UpsertAction.CREATED
+            existing_attachment = confluence.create_attachment(
+                confluence_page=existing_page, fp=fp, message=attachment_message
+            )
+        else:
             action = UpsertAction.UPDATED
+            existing_attachment = confluence.update_attachment(
+                confluence_page=existing_page,
+                fp=fp,
+                existing_attachment=existing_attachment,
+                message=attachment_message,
+            )
 
     return UpsertResult(action=action, response=existing_attachment)
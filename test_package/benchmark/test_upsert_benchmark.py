@@ -0,0 +1,46 @@
+import md2cf.upsert
+from md2cf.api import bunchify
+from md2cf.document import Page, new_content_hash
+
+PAGE_COUNT = 500
+
+
+def make_pages_and_existing_pages():
+    """Unchanged pages with labels, as they would be found on Confluence by a run
+    with --only-changed and --replace-all-labels"""
+    pages_and_existing_pages = []
+    for page_number in range(PAGE_COUNT):
+        body = f"<p>Page number {page_number}</p>" * 100
+        labels = [f"label{label_number}" for label_number in range(5)]
+        page = Page(
+            title=f"Page {page_number}", body=body, labels=labels, parent_id="1"
+        )
+        body_hash = new_content_hash()
+        body_hash.update(body.encode())
+        existing_page = bunchify(
+            {
+                "ancestors": [{"id": "1"}],
+                "version": {
+                    "message": f"Uploaded by md2cf [vb{body_hash.hexdigest()}]"
+                },
+                "metadata": {
+                    "labels": {"results": [{"name": label} for label in labels]}
+                },
+            }
+        )
+        pages_and_existing_pages.append((page, existing_page))
+    return pages_and_existing_pages
+
+
+def test_page_needs_updating_benchmark(benchmark):
+    pages_and_existing_pages = make_pages_and_existing_pages()
+
+    def check_all_pages():
+        return [
+            md2cf.upsert.page_needs_updating(
+                page, existing_page, replace_all_labels=True
+            )
+            for page, existing_page in pages_and_existing_pages
+        ]
+
+    assert not any(benchmark(check_all_pages))
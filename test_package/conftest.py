@@ -0,0 +1,10 @@
+import pytest
+
+from md2cf import ignored_files
+
+
+@pytest.fixture(autouse=True)
+def clear_git_root_cache():
+    """The fake filesystem is rebuilt for every test, so cached git roots from
+    previous tests can't be trusted"""
+    ignored_files._find_git_root.cache_clear()
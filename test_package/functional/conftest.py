@@ -0,0 +1,22 @@
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+
+
+class RenderingTestData(NamedTuple):
+    markdown_path: Path
+    markdown_data: str
+    result_data: str
+
+
+@pytest.fixture(scope="session")
+def full_rendering_data():
+    """The test document and its expected rendering, read once per session"""
+    script_loc = Path(__file__).parent
+    markdown_path = script_loc / "test.md"
+    return RenderingTestData(
+        markdown_path=markdown_path,
+        markdown_data=markdown_path.read_text(),
+        result_data=(script_loc / "result.xml").read_text(),
+    )
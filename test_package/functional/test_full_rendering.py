@@ -3,22 +3,26 @@ import pytest
 from md2cf import document
 
 
-@pytest.fixture(scope="module")
-def script_loc(request):
-    """Return the directory of the currently running test script"""
-
-    # uses .join instead of .dirname, so we get a LocalPath object instead of
-    # a string. LocalPath.join calls normpath for us when joining the path
-    return request.fspath.join("..")
-
-
-def test_full_document(script_loc):
-    markdown_path = script_loc.join("test.md")
-
-    with open(str(script_loc.join("result.xml"))) as result_file:
-        result_data = result_file.read()
-
-    page = document.get_page_data_from_file_path(markdown_path)
-
-    assert page.body == result_data
+# Keep all the variants on one xdist worker, so they share the session fixture
+@pytest.mark.xdist_group("full_rendering")
+@pytest.mark.parametrize(
+    "get_page",
+    [
+        pytest.param(
+            lambda data: document.get_page_data_from_file_path(data.markdown_path),
+            id="from_file_path",
+        ),
+        pytest.param(
+            lambda data: document.get_page_data_from_text(data.markdown_data),
+            id="from_text",
+        ),
+        pytest.param(
+            lambda data: document.parse_page(data.markdown_data), id="parse_page"
+        ),
+    ],
+)
+def test_full_document(full_rendering_data, get_page):
+    page = get_page(full_rendering_data)
+
+    assert page.body == full_rendering_data.result_data
     assert page.title == "Markdown: Syntax"
@@ -1,44 +1,67 @@
 import io
+import urllib.parse
 
 import pytest
+import requests
 
+from md2cf.api import Bunch, MinimalConfluence, MultipartFileBody, bunchify
 
-def bunchify(obj):
-    if isinstance(obj, (list, tuple)):
-        return [bunchify(item) for item in obj]
-    if isinstance(obj, dict):
-        return Bunch(obj)
-    return obj
+TEST_HOST = "http://example.com/api/"
+CONTENT_URL = TEST_HOST + "content"
+SEARCH_URL = CONTENT_URL + "/search"
+# Most tests use these IDs for their pages
+PAGE_URL = CONTENT_URL + "/12345"
+ATTACHMENTS_URL = CONTENT_URL + "/123/child/attachment"
+# Shared by every page body sent by create_page and update_page
+STORAGE = {"representation": "storage"}
 
 
-class Bunch(dict):
-    def __init__(self, kwargs=None):
-        if kwargs is None:
-            kwargs = {}
-        for key, value in kwargs.items():
-            kwargs[key] = bunchify(value)
-        super(Bunch, self).__init__(kwargs)
-        self.__dict__ = self
+@pytest.fixture(scope="module")
+def confluence():
+    # requests_mock patches every session, so the same client can be shared by
+    # all the tests
+    c = MinimalConfluence(host=TEST_HOST, username="foo", password="bar")
 
+    return c
 
-TEST_HOST = "http://example.com/api/"
 
+@pytest.fixture
+def attachment_fp():
+    # Uploading reads the file to the end, so every test gets its own
+    return io.BytesIO(b"12345")
 
-@pytest.fixture()
-def confluence():
-    from md2cf.api import MinimalConfluence
 
-    c = MinimalConfluence(host=TEST_HOST, username="foo", password="bar")
+def test_bunchify():
+    original = {"a": {"b": [{"c": 1}, (2, {"d": None})]}, "e": "x"}
 
-    return c
+    bunch = bunchify(original)
 
+    assert bunch == {"a": {"b": [{"c": 1}, [2, {"d": None}]]}, "e": "x"}
+    assert bunch.a.b[0].c == 1
+    assert bunch.a.b[1][1].d is None
+    assert bunchify([original])[0].e == "x"
+    assert bunchify("scalar") == "scalar"
 
-def test_user_pass_auth():
-    import md2cf.api as api
 
-    c = api.MinimalConfluence(
-        host="http://example.com/", username="foo", password="bar"
-    )
+def test_bunch_does_not_modify_its_argument():
+    original = {"a": {"b": 1}}
+
+    bunch = Bunch(original)
+
+    assert bunch.a.b == 1
+    assert type(original["a"]) is dict
+
+
+def test_bunch_from_pairs():
+    bunch = Bunch([("a", {"b": 1}), ("c", 2)])
+
+    assert bunch == {"a": {"b": 1}, "c": 2}
+    assert bunch.a.b == 1
+    assert Bunch() == {}
+
+
+def test_user_pass_auth():
+    c = MinimalConfluence(host="http://example.com/", username="foo", password="bar")
 
     auth = c.api.auth
 
@@ -46,86 +69,126 @@ def test_user_pass_auth():
 
 
 def test_token_auth():
-    import md2cf.api as api
-
-    c = api.MinimalConfluence(host="http://example.com/", token="hello")
+    c = MinimalConfluence(host="http://example.com/", token="hello")
 
     assert c.api.auth is None
     assert c.api.headers["Authorization"] == "Bearer hello"
 
 
-def test_get_page_with_page_id(confluence, requests_mock):
+@pytest.mark.parametrize(
+    "additional_expansions,query",
+    [
+        pytest.param(None, "", id="no_expansions"),
+        pytest.param(["history"], "?expand=history", id="one_expansion"),
+        pytest.param(
+            ["history", "version"], "?expand=history,version", id="two_expansions"
+        ),
+    ],
+)
+def test_get_page_with_page_id(confluence, requests_mock, additional_expansions, query):
     test_page_id = 12345
     test_return_value = {"some_stuff": 1}
 
-    requests_mock.get(TEST_HOST + f"content/{test_page_id}", json=test_return_value)
-    page = confluence.get_page(page_id=test_page_id)
+    requests_mock.get(PAGE_URL + query, complete_qs=True, json=test_return_value)
+    page = confluence.get_page(
+        page_id=test_page_id, additional_expansions=additional_expansions
+    )
 
-    assert page == bunchify(test_return_value)
+    assert page == test_return_value
 
 
-def test_get_page_with_page_id_and_one_expansion(confluence, requests_mock):
-    test_page_id = 12345
-    test_return_value = {"some_stuff": 1}
+def test_responses_are_converted_to_bunches(confluence, requests_mock):
+    test_return_value = {"version": {"number": 3}, "ancestors": [{"id": 1}]}
 
-    requests_mock.get(
-        TEST_HOST + f"content/{test_page_id}?expand=history",
-        complete_qs=True,
-        json=test_return_value,
-    )
-    page = confluence.get_page(page_id=test_page_id, additional_expansions=["history"])
+    requests_mock.get(PAGE_URL, json=test_return_value)
+    page = confluence.get_page(page_id=12345)
 
     assert page == test_return_value
+    assert type(page.version) is Bunch
+    assert page.version.number == 3
+    assert page.ancestors[0].id == 1
 
 
-def test_get_page_with_page_id_and_multiple_expansions(confluence, requests_mock):
-    test_page_id = 12345
-    test_return_value = {"some_stuff": 1}
+def get_query(request):
+    # requests_mock lowercases the parsed query string in request.qs, so the CQL
+    # is decoded from the URL to check it with its real casing
+    return urllib.parse.parse_qs(urllib.parse.urlsplit(request.url).query)
+
 
+def test_get_pages(confluence, requests_mock):
     requests_mock.get(
-        TEST_HOST + f"content/{test_page_id}?expand=history,version",
-        complete_qs=True,
-        json=test_return_value,
+        SEARCH_URL,
+        json={
+            "results": [
+                {"id": 1, "title": "first"},
+                {"id": 2, "title": 'a "quoted" title'},
+                {"id": 3, "title": "FIRST"},
+            ],
+            "_links": {},
+        },
     )
-    page = confluence.get_page(
-        page_id=test_page_id, additional_expansions=["history", "version"]
+    pages = confluence.get_pages(
+        titles=["first", 'a "quoted" title', "missing"],
+        space_key="SPACE",
+        additional_expansions=["history", "version"],
     )
 
-    assert page == test_return_value
-
+    assert pages == {
+        "first": {"id": 1, "title": "first"},
+        'a "quoted" title': {"id": 2, "title": 'a "quoted" title'},
+    }
+    query = get_query(requests_mock.last_request)
+    assert query["cql"] == [
+        'space = "SPACE" AND type = "page" AND title in '
+        '("first", "a \\"quoted\\" title", "missing")'
+    ]
+    assert query["expand"] == ["history,version"]
+
+
+def test_get_pages_in_batches(confluence, requests_mock):
+    requests_mock.get(SEARCH_URL, json={"results": [], "_links": {}})
+    pages = confluence.get_pages(
+        titles=["one", "two", "three", "one"], space_key="SPACE", batch_size=2
+    )
 
-def test_get_page_with_title(confluence, mocker, requests_mock):
+    assert pages == {}
+    assert [get_query(request)["cql"] for request in requests_mock.request_history] == [
+        ['space = "SPACE" AND type = "page" AND title in ("one", "two")'],
+        ['space = "SPACE" AND type = "page" AND title in ("three")'],
+    ]
+
+
+@pytest.mark.parametrize(
+    "kwargs,query",
+    [
+        pytest.param({}, "", id="title"),
+        pytest.param({"space_key": "ABC"}, "&spaceKey=ABC", id="title_and_space"),
+        pytest.param(
+            {"additional_expansions": ["history", "version"]},
+            "&expand=history,version",
+            id="title_and_expansions",
+        ),
+    ],
+)
+def test_get_page_with_title(confluence, requests_mock, kwargs, query):
     test_page_title = "hellothere"
-    test_page_id = 12345
-    test_return_value = {"results": [{"id": test_page_id}]}
+    test_return_value = {"results": [{"id": 12345, "version": {"number": 3}}]}
 
     requests_mock.get(
-        TEST_HOST + f"content?title={test_page_title}&type=page",
+        CONTENT_URL + f"?title={test_page_title}&type=page" + query,
         complete_qs=True,
         json=test_return_value,
     )
-    requests_mock.get(TEST_HOST + f"content/{test_page_id}", json=test_return_value)
-    page = confluence.get_page(title=test_page_title)
+    page = confluence.get_page(title=test_page_title, **kwargs)
 
-    assert page == bunchify(test_return_value)
+    assert page == test_return_value["results"][0]
+    assert requests_mock.call_count == 1
 
 
-def test_get_page_with_title_and_space(confluence, mocker, requests_mock):
-    test_page_title = "hellothere"
-    test_page_id = 12345
-    test_page_space = "ABC"
-    test_return_value = {"results": [{"id": test_page_id}]}
+def test_get_page_with_title_not_found(confluence, requests_mock):
+    requests_mock.get(CONTENT_URL, json={"results": []})
 
-    requests_mock.get(
-        TEST_HOST
-        + f"content?title={test_page_title}&type=page&spaceKey={test_page_space}",
-        complete_qs=True,
-        json=test_return_value,
-    )
-    requests_mock.get(TEST_HOST + f"content/{test_page_id}", json=test_return_value)
-    page = confluence.get_page(title=test_page_title, space_key=test_page_space)
-
-    assert page == bunchify(test_return_value)
+    assert confluence.get_page(title="hellothere") is None
 
 
 def test_get_page_with_all_parameters(confluence, mocker, requests_mock):
@@ -135,7 +198,7 @@ def test_get_page_with_all_parameters(confluence, mocker, requests_mock):
     test_return_value = {"results": [{"id": test_page_id}]}
 
     requests_mock.get(
-        TEST_HOST + f"content/{test_page_id}?expand=history",
+        PAGE_URL + "?expand=history",
         complete_qs=True,
         json=test_return_value,
     )
@@ -160,116 +223,45 @@ def test_get_page_without_title_or_id(confluence, requests_mock):
         confluence.get_page(space_key="ABC")
 
 
-def test_create_page(confluence, requests_mock):
-    test_title = "This is a title"
-    test_space = "ABC"
-    test_body = "<p>This is some content</p>"
-
-    page_structure = {
-        "title": test_title,
-        "type": "page",
-        "space": {"key": test_space},
-        "body": {"storage": {"value": test_body, "representation": "storage"}},
-    }
-
-    created_page = {"test": 1}
-
-    requests_mock.post(
-        TEST_HOST + "content",
-        complete_qs=True,
-        json=created_page,
-        additional_matcher=lambda x: x.json() == page_structure,
-    )
-    page = confluence.create_page(space=test_space, title=test_title, body=test_body)
-
-    assert page == created_page
-
-
-def test_create_page_with_parent(confluence, requests_mock):
-    test_title = "This is a title"
-    test_space = "ABC"
-    test_body = "<p>This is some content</p>"
-    test_parent_id = 12345
-
-    page_structure = {
-        "title": test_title,
-        "type": "page",
-        "space": {"key": test_space},
-        "body": {"storage": {"value": test_body, "representation": "storage"}},
-        "ancestors": [{"id": test_parent_id}],
-    }
-
-    created_page = {"test": 1}
-    requests_mock.post(
-        TEST_HOST + "content",
-        complete_qs=True,
-        json=created_page,
-        additional_matcher=lambda x: x.json() == page_structure,
-    )
-
-    page = confluence.create_page(
-        space=test_space, title=test_title, body=test_body, parent_id=test_parent_id
-    )
-
-    assert page == created_page
-
-
-def test_create_page_with_string_parent(confluence, requests_mock):
-    test_title = "This is a title"
-    test_space = "ABC"
-    test_body = "<p>This is some content</p>"
-    test_parent_id = "12345"
-
-    page_structure = {
-        "title": test_title,
-        "type": "page",
-        "space": {"key": test_space},
-        "body": {"storage": {"value": test_body, "representation": "storage"}},
-        "ancestors": [{"id": int(test_parent_id)}],
-    }
-
-    created_page = {"test": 1}
-    requests_mock.post(
-        TEST_HOST + "content",
-        complete_qs=True,
-        json=created_page,
-        additional_matcher=lambda x: x.json() == page_structure,
-    )
-
-    page = confluence.create_page(
-        space=test_space, title=test_title, body=test_body, parent_id=test_parent_id
-    )
-
-    assert page == created_page
-
-
-def test_create_page_with_message(confluence, requests_mock):
+@pytest.mark.parametrize(
+    "kwargs,extra_structure",
+    [
+        pytest.param({}, {}, id="no_extras"),
+        pytest.param({"parent_id": 12345}, {"ancestors": [{"id": 12345}]}, id="parent"),
+        pytest.param(
+            {"parent_id": "12345"},
+            {"ancestors": [{"id": 12345}]},
+            id="string_parent",
+        ),
+        pytest.param(
+            {"update_message": "This is an insightful message"},
+            {"version": {"message": "This is an insightful message"}},
+            id="message",
+        ),
+    ],
+)
+def test_create_page(confluence, requests_mock, kwargs, extra_structure):
     test_title = "This is a title"
     test_space = "ABC"
     test_body = "<p>This is some content</p>"
-    test_update_message = "This is an insightful message"
 
     page_structure = {
         "title": test_title,
         "type": "page",
         "space": {"key": test_space},
-        "body": {"storage": {"value": test_body, "representation": "storage"}},
-        "version": {"message": test_update_message},
+        "body": {"storage": {**STORAGE, "value": test_body}},
+        **extra_structure,
     }
 
     created_page = {"test": 1}
     requests_mock.post(
-        TEST_HOST + "content",
+        CONTENT_URL,
         complete_qs=True,
         json=created_page,
         additional_matcher=lambda x: x.json() == page_structure,
     )
-
     page = confluence.create_page(
-        space=test_space,
-        title=test_title,
-        body=test_body,
-        update_message=test_update_message,
+        space=test_space, title=test_title, body=test_body, **kwargs
     )
 
     assert page == created_page
@@ -294,12 +286,12 @@ def test_update_page(confluence, requests_mock):
         "version": {"number": test_page_version + 1, "minorEdit": False},
         "title": test_page_title,
         "type": "page",
-        "body": {"storage": {"value": test_new_body, "representation": "storage"}},
+        "body": {"storage": {**STORAGE, "value": test_new_body}},
     }
 
     updated_page = {"test": 1}
     requests_mock.put(
-        TEST_HOST + f"content/{test_page_id}",
+        PAGE_URL,
         complete_qs=True,
         json=updated_page,
         additional_matcher=lambda x: x.json() == update_structure,
@@ -334,12 +326,12 @@ def test_update_page_with_message(confluence, requests_mock):
         },
         "title": test_page_title,
         "type": "page",
-        "body": {"storage": {"value": test_new_body, "representation": "storage"}},
+        "body": {"storage": {**STORAGE, "value": test_new_body}},
     }
 
     updated_page = {"test": 1}
     requests_mock.put(
-        TEST_HOST + f"content/{test_page_id}",
+        PAGE_URL,
         complete_qs=True,
         json=updated_page,
         additional_matcher=lambda x: x.json() == update_structure,
@@ -352,37 +344,107 @@ def test_update_page_with_message(confluence, requests_mock):
     assert page == updated_page
 
 
-def test_create_attachment(mocker, confluence, requests_mock):
+def test_get_attachments(confluence, requests_mock):
+    test_page = bunchify({"id": 123})
+
+    requests_mock.get(
+        ATTACHMENTS_URL + "?expand=version&limit=200",
+        complete_qs=True,
+        json={
+            "results": [{"id": 1, "title": "image.png"}],
+            "_links": {
+                "base": "http://example.com",
+                "next": "/api/content/123/child/attachment?cursor=abc",
+            },
+        },
+    )
+    requests_mock.get(
+        ATTACHMENTS_URL + "?cursor=abc",
+        complete_qs=True,
+        json={"results": [{"id": 2, "title": "other.png"}], "_links": {}},
+    )
+    attachments = confluence.get_attachments(test_page)
+
+    assert attachments == {
+        "image.png": {"id": 1, "title": "image.png"},
+        "other.png": {"id": 2, "title": "other.png"},
+    }
+
+
+def test_create_attachment(confluence, requests_mock, attachment_fp):
     test_page = bunchify({"id": 123})
-    file_contents = b"12345"
-    test_fp = io.BytesIO(file_contents)
 
     test_response = {"test": 1}
     requests_mock.post(
-        TEST_HOST + f"content/{test_page.id}/child/attachment?allowDuplicated=true",
+        ATTACHMENTS_URL + "?allowDuplicated=true",
         complete_qs=True,
         json=test_response,
         headers={"X-Atlassian-Token": "nocheck"},
     )
-    response = confluence.create_attachment(test_page, test_fp)
+    response = confluence.create_attachment(test_page, attachment_fp)
 
     assert response == test_response
 
 
-def test_update_attachment(mocker, confluence, requests_mock):
+def test_update_attachment(confluence, requests_mock, attachment_fp):
     test_page = bunchify({"id": 123})
     test_attachment = bunchify({"id": 3241})
-    file_contents = b"12345"
-    test_fp = io.BytesIO(file_contents)
 
     test_response = {"test": 1}
     requests_mock.post(
-        TEST_HOST
-        + f"content/{test_page.id}/child/attachment/{test_attachment.id}/data",
+        ATTACHMENTS_URL + f"/{test_attachment.id}/data",
         complete_qs=True,
         json=test_response,
         headers={"X-Atlassian-Token": "nocheck"},
     )
-    response = confluence.update_attachment(test_page, test_fp, test_attachment)
+    response = confluence.update_attachment(test_page, attachment_fp, test_attachment)
 
     assert response == test_response
+
+
+def test_create_attachment_sends_file_and_comment(
+    confluence, requests_mock, attachment_fp
+):
+    test_page = bunchify({"id": 123})
+    attachment_fp.name = "/some/folder/image.png"
+
+    requests_mock.post(
+        ATTACHMENTS_URL + "?allowDuplicated=true",
+        complete_qs=True,
+        json={"test": 1},
+    )
+    confluence.create_attachment(test_page, attachment_fp, message="a comment")
+
+    request = requests_mock.last_request
+    body = request.body.read()
+    assert request.headers["Content-Length"] == str(len(body))
+    assert request.headers["Content-Type"].startswith("multipart/form-data; boundary=")
+    assert b'name="file"; filename="image.png"\r\n\r\n12345\r\n' in body
+    assert b'name="comment"; filename="comment"\r\n\r\na comment\r\n' in body
+
+
+def test_multipart_file_body_matches_requests_encoding():
+    file_contents = b"12345" * 1000
+    test_fp = io.BytesIO(file_contents)
+    test_fp.name = "image.png"
+    reference_fp = io.BytesIO(file_contents)
+    reference_fp.name = "image.png"
+
+    body = MultipartFileBody(test_fp, comment="a comment")
+    boundary = body.content_type.split("boundary=")[1]
+    (
+        expected_body,
+        expected_content_type,
+    ) = requests.models.RequestEncodingMixin()._encode_files(
+        {"file": reference_fp, "comment": "a comment"}, None
+    )
+    expected_body = expected_body.replace(
+        expected_content_type.split("boundary=")[1].encode(), boundary.encode()
+    )
+
+    assert len(body) == len(expected_body)
+    assert body.read(10) + body.read(4096) + body.read() == expected_body
+    assert body.read() == b""
+
+    body.seek(0)
+    assert body.read() == expected_body
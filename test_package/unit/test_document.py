@@ -10,7 +10,18 @@ ROOT_GITIGNORE = """.git
 def test_page_get_content_hash():
     p = doc.Page(title="test title", body="test content")
 
-    assert p.get_content_hash() == "1eebdf4fdc9fc7bf283031b93f9aef3338de9052"
+    assert p.get_content_hash() == "62827c110b8c45280c68ccc9d14a7f91576bfad5"
+    assert p.get_content_hash(legacy=True) == "1eebdf4fdc9fc7bf283031b93f9aef3338de9052"
+
+
+def test_page_get_content_hash_follows_body_changes():
+    p = doc.Page(title="test title", body="test content")
+    original_hash = p.get_content_hash()
+
+    p.body = "preface" + p.body
+
+    assert p.get_content_hash() != original_hash
+    assert p.get_content_hash() == doc.Page(title=None, body=p.body).get_content_hash()
 
 
 def test_get_pages_from_directory(fs):
@@ -22,7 +33,7 @@ def test_get_pages_from_directory(fs):
     assert result == [
         FakePage(
             title="root-folder-file",
-            file_path=Path("/root-folder/root-folder-file.md", parent_title=None),
+            file_path=Path("/root-folder/root-folder-file.md"),
         ),
         FakePage(title="parent", file_path=None, parent_title=None),
         FakePage(title="child", file_path=None, parent_title="parent"),
@@ -50,7 +61,7 @@ def test_get_pages_from_directory_use_pages(fs):
     assert result == [
         FakePage(
             title="root-folder-file",
-            file_path=Path("/root-folder/root-folder-file.md", parent_title=None),
+            file_path=Path("/root-folder/root-folder-file.md"),
         ),
         FakePage(title="parent", file_path=None, parent_title=None),
         FakePage(title="child", file_path=None, parent_title="parent"),
@@ -62,6 +73,22 @@ def test_get_pages_from_directory_use_pages(fs):
     ]
 
 
+def test_get_pages_from_directory_skips_ignored_directories(fs):
+    fs.create_file("/root-folder/.gitignore", contents="ignored-dir/\n")
+    fs.create_dir("/root-folder/.git")
+    fs.create_file("/root-folder/root-folder-file.md")
+    fs.create_file("/root-folder/ignored-dir/ignored-file.md")
+    fs.create_file("/root-folder/ignored-dir/nested/nested-file.md")
+
+    result = doc.get_pages_from_directory(Path("/root-folder"))
+    assert result == [
+        FakePage(
+            title="root-folder-file",
+            file_path=Path("/root-folder/root-folder-file.md"),
+        ),
+    ]
+
+
 def test_get_pages_from_directory_collapse_single_pages(fs):
     fs.create_file("/root-folder/root-folder-file.md")
     fs.create_file("/root-folder/parent/child/child-file.md")
@@ -72,7 +99,7 @@ def test_get_pages_from_directory_collapse_single_pages(fs):
     assert result == [
         FakePage(
             title="root-folder-file",
-            file_path=Path("/root-folder/root-folder-file.md", parent_title=None),
+            file_path=Path("/root-folder/root-folder-file.md"),
         ),
         FakePage(title="parent", file_path=None, parent_title=None),
         FakePage(
@@ -109,7 +136,7 @@ def test_get_pages_from_directory_skip_empty(fs):
     assert result == [
         FakePage(
             title="root-folder-file",
-            file_path=Path("/root-folder/root-folder-file.md", parent_title=None),
+            file_path=Path("/root-folder/root-folder-file.md"),
         ),
         FakePage(
             title="child",
@@ -150,7 +177,7 @@ def test_get_pages_from_directory_collapse_empty(fs):
     assert result == [
         FakePage(
             title="root-folder-file",
-            file_path=Path("/root-folder/root-folder-file.md", parent_title=None),
+            file_path=Path("/root-folder/root-folder-file.md"),
         ),
         FakePage(
             title="parent/child",
@@ -248,6 +275,30 @@ def test_get_pages_from_directory_with_pages_file_single_level(fs):
     ]
 
 
+def test_get_pages_from_directory_parallel_rendering(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc, "PARALLEL_RENDERING_THRESHOLD", 0)
+    monkeypatch.setattr(doc.os, "cpu_count", lambda: 2)
+    root_folder = tmp_path / "root-folder"
+    (root_folder / "parent").mkdir(parents=True)
+    (root_folder / "root-folder-file.md").write_text("# Root title\n")
+    (root_folder / "parent" / "child-file.md").write_text("Some content\n")
+
+    result = doc.get_pages_from_directory(root_folder, use_gitignore=False)
+    assert result == [
+        FakePage(
+            title="Root title",
+            file_path=root_folder / "root-folder-file.md",
+        ),
+        FakePage(title="parent", file_path=None, parent_title=None),
+        FakePage(
+            title="child-file",
+            body="<p>Some content</p>\n",
+            file_path=root_folder / "parent" / "child-file.md",
+            parent_title="parent",
+        ),
+    ]
+
+
 def test_get_document_frontmatter():
     source_markdown = """---
 title: This is a title
@@ -260,10 +311,10 @@ labels:
 Yep.
 """
 
-    assert doc.get_document_frontmatter(source_markdown.splitlines(keepends=True)) == {
+    assert doc.get_document_frontmatter(source_markdown) == {
         "title": "This is a title",
         "labels": ["label1", "label2"],
-        "frontmatter_end_line": 6,
+        "frontmatter_end": 61,
     }
 
 
@@ -280,12 +331,29 @@ With other triple dashes!
 Yep.
 """
 
-    assert doc.get_document_frontmatter(source_markdown.splitlines(keepends=True)) == {
+    assert doc.get_document_frontmatter(source_markdown) == {
         "title": "This is a title",
-        "frontmatter_end_line": 3,
+        "frontmatter_end": 31,
     }
 
 
+def test_get_page_data_from_lines():
+    markdown_lines = [
+        "---\n",
+        "title: This is a title\n",
+        "labels:\n",
+        "  - label1\n",
+        "---\n",
+        "Yep.\n",
+    ]
+
+    page = doc.get_page_data_from_lines(markdown_lines)
+
+    assert page.title == "This is a title"
+    assert page.labels == ["label1"]
+    assert page.body == doc.get_page_data_from_text("".join(markdown_lines)).body
+
+
 def test_get_document_frontmatter_no_closing():
     source_markdown = """---
 # This is normal markdown content
@@ -293,7 +361,7 @@ def test_get_document_frontmatter_no_closing():
 Yep.
 """
 
-    assert doc.get_document_frontmatter(source_markdown.splitlines(keepends=True)) == {}
+    assert doc.get_document_frontmatter(source_markdown) == {}
 
 
 def test_get_document_frontmatter_extra_whitespace():
@@ -307,7 +375,7 @@ title: This is a title
 Yep.
 """
 
-    assert doc.get_document_frontmatter(source_markdown.splitlines(keepends=True)) == {}
+    assert doc.get_document_frontmatter(source_markdown) == {}
 
 
 def test_get_document_frontmatter_empty():
@@ -318,4 +386,4 @@ def test_get_document_frontmatter_empty():
 Yep.
 """
 
-    assert doc.get_document_frontmatter(source_markdown.splitlines(keepends=True)) == {}
+    assert doc.get_document_frontmatter(source_markdown) == {}
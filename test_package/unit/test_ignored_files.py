@@ -1,5 +1,7 @@
+import os
 from pathlib import Path
 
+import gitignorefile
 from pyfakefs.fake_filesystem import FakeFilesystem
 
 from md2cf.ignored_files import GitRepository
@@ -76,3 +78,64 @@ def test_is_ignored_with_disabled_gitignores(fs):
     assert not git_repo.is_ignored(root_path / "subdir_included/README.md")
     assert not git_repo.is_ignored(root_path / "subdir_root_ignore/README.md")
     assert not git_repo.is_ignored(root_path / "subdir_local_ignore/README.md")
+
+
+def test_collect_gitignores_checks_each_directory_once(fs, mocker):
+    root_path = Path("/repo")
+    _create_test_project(fs, root_path)
+    git_repo = GitRepository(root_path)
+
+    git_repo.collect_gitignores(root_path / "subdir_local_ignore")
+    isfile_spy = mocker.spy(os.path, "isfile")
+    gitignores = git_repo.collect_gitignores(root_path / "subdir_local_ignore")
+
+    assert gitignores == [
+        root_path / "subdir_local_ignore/.gitignore",
+        root_path / ".gitignore",
+    ]
+    assert not any(
+        call[0][0].endswith(".gitignore") for call in isfile_spy.call_args_list
+    )
+
+
+def test_is_ignored_parses_each_gitignore_once(fs, mocker):
+    root_path = Path("/repo")
+    _create_test_project(fs, root_path)
+    fs.create_file(root_path / "subdir_included/other.md", contents=README)
+    git_repo = GitRepository(root_path)
+    parse_spy = mocker.spy(gitignorefile, "parse")
+
+    assert not git_repo.is_ignored(root_path / "README.md")
+    assert not git_repo.is_ignored(root_path / "subdir_included/README.md")
+    assert not git_repo.is_ignored(root_path / "subdir_included/other.md")
+    assert git_repo.is_ignored(root_path / "subdir_local_ignore/README.md")
+    assert git_repo.is_ignored(root_path / "subdir_root_ignore/README.md")
+
+    assert sorted(call[0][0] for call in parse_spy.call_args_list) == [
+        str(root_path / ".gitignore"),
+        str(root_path / "subdir_local_ignore/.gitignore"),
+    ]
+
+
+def test_collect_gitignores_outside_of_repository(fs):
+    root_path = Path("/repo")
+    _create_test_project(fs, root_path)
+    fs.create_file("/elsewhere/.gitignore", contents=GITIGNORE)
+    git_repo = GitRepository(root_path)
+
+    assert git_repo.collect_gitignores(Path("/elsewhere")) == []
+    assert git_repo.collect_gitignores(root_path) == [root_path / ".gitignore"]
+
+
+def test_is_ignored_directory(fs):
+    root_path = Path("/repo")
+    fs.create_dir(root_path / ".git")
+    fs.create_file(root_path / ".gitignore", contents=".git\nbuild/\n")
+    fs.create_dir(root_path / "build/nested")
+    fs.create_dir(root_path / "src")
+    git_repo = GitRepository(root_path)
+
+    assert git_repo.is_ignored(root_path / ".git")
+    assert git_repo.is_ignored(root_path / "build")
+    assert git_repo.is_ignored(root_path / "build/nested")
+    assert not git_repo.is_ignored(root_path / "src")
@@ -0,0 +1,144 @@
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import md2cf.__main__
+from md2cf.api import MinimalConfluence as Confluence
+from md2cf.document import Page
+from md2cf.upsert import UpsertAction, UpsertResult
+
+
+@pytest.fixture()
+def confluence(mocker):
+    return mocker.Mock(spec=Confluence)
+
+
+def make_args(**kwargs):
+    args = dict(dry_run=False, debug=False, message="", only_changed=False)
+    args.update(kwargs)
+    return SimpleNamespace(**args)
+
+
+def make_pages(count):
+    return [
+        Page(space="SPACE", title=f"page {index}", body="") for index in range(count)
+    ]
+
+
+def test_prefetch_existing_pages(mocker, confluence):
+    get_existing_pages_mock = mocker.patch(
+        "md2cf.__main__.get_existing_pages", return_value=mocker.sentinel.pages
+    )
+    pages = make_pages(2)
+
+    existing_pages = md2cf.__main__.prefetch_existing_pages(
+        make_args(), confluence, pages
+    )
+
+    assert existing_pages == mocker.sentinel.pages
+    get_existing_pages_mock.assert_called_once_with(confluence, pages)
+
+
+@pytest.mark.parametrize(
+    "args,pages",
+    [
+        pytest.param(make_args(dry_run=True), make_pages(2), id="dry_run"),
+        pytest.param(make_args(), make_pages(1), id="single_page"),
+        pytest.param(
+            make_args(),
+            [Page(title="one", body="", page_id="1"), *make_pages(1)],
+            id="single_page_without_id",
+        ),
+    ],
+)
+def test_prefetch_existing_pages_not_needed(mocker, confluence, args, pages):
+    """A single page takes one request either way, so it isn't looked up in bulk"""
+    get_existing_pages_mock = mocker.patch("md2cf.__main__.get_existing_pages")
+
+    assert md2cf.__main__.prefetch_existing_pages(args, confluence, pages) is None
+    get_existing_pages_mock.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        requests.HTTPError("400 Client Error"),
+        requests.ConnectionError("Connection refused"),
+    ],
+)
+def test_prefetch_existing_pages_error(mocker, confluence, error):
+    """Failing to look up pages in bulk isn't fatal, pages are then looked up one
+    at a time by upsert_page"""
+    mocker.patch("md2cf.__main__.get_existing_pages", side_effect=error)
+    error_console_mock = mocker.patch("md2cf.__main__.error_console")
+
+    existing_pages = md2cf.__main__.prefetch_existing_pages(
+        make_args(), confluence, make_pages(2)
+    )
+
+    assert existing_pages is None
+    error_console_mock.log.assert_called_once()
+
+
+@pytest.fixture()
+def attachment_page():
+    return Page(
+        title="title",
+        body="",
+        attachments=[Path("a.png"), Path("b.png"), Path("c.png")],
+    )
+
+
+def upsert_page_attachments(mocker, confluence, page):
+    confluence.get_attachments.return_value = {}
+    md2cf.__main__.upsert_page_attachments(
+        make_args(),
+        confluence,
+        page,
+        UpsertResult(action=UpsertAction.UPDATED, response=mocker.sentinel.page),
+        mocker.sentinel.page_progress,
+        mocker.Mock(),
+    )
+
+
+def test_upsert_page_attachments(mocker, confluence, attachment_page):
+    """Attachments are uploaded concurrently"""
+    # Every upload waits until all of them have started, which times out if they
+    # are uploaded one at a time
+    all_uploads_started = threading.Barrier(len(attachment_page.attachments))
+
+    def upload(attachment, **kwargs):
+        all_uploads_started.wait(timeout=5)
+        return UpsertResult(action=UpsertAction.CREATED, response=attachment)
+
+    upsert_attachment_mock = mocker.patch(
+        "md2cf.__main__.upsert_attachment", side_effect=upload
+    )
+
+    upsert_page_attachments(mocker, confluence, attachment_page)
+
+    assert sorted(
+        call[1]["attachment"] for call in upsert_attachment_mock.call_args_list
+    ) == [Path("a.png"), Path("b.png"), Path("c.png")]
+
+
+def test_upsert_page_attachments_error(mocker, confluence, attachment_page):
+    """An attachment that fails to upload is reported, but doesn't stop the others
+    from being uploaded"""
+    uploaded = []
+
+    def upload(attachment, **kwargs):
+        if attachment == Path("a.png"):
+            raise requests.HTTPError("500 Server Error")
+        uploaded.append(attachment)
+        return UpsertResult(action=UpsertAction.CREATED, response=attachment)
+
+    mocker.patch("md2cf.__main__.upsert_attachment", side_effect=upload)
+
+    with pytest.raises(requests.HTTPError):
+        upsert_page_attachments(mocker, confluence, attachment_page)
+
+    assert sorted(uploaded) == [Path("b.png"), Path("c.png")]
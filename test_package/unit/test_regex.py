@@ -1,4 +1,11 @@
-from md2cf.upsert import CONTENT_HASH_REGEX
+import pytest
+
+from md2cf.upsert import (
+    CONTENT_HASH_REGEX,
+    ContentHash,
+    get_content_hash_from_message,
+    tag_message_with_hash,
+)
 
 
 def test_hash_messge(mocker):
@@ -7,17 +14,77 @@ def test_hash_messge(mocker):
         "hello there [v11dd64d04e0bf92935910a7e73fed39675b1f9a2]"
     )
     assert result is not None
-    assert result.group(1) == "11dd64d04e0bf92935910a7e73fed39675b1f9a2"
+    assert result.group(1) == ""
+    assert result.group(2) == "11dd64d04e0bf92935910a7e73fed39675b1f9a2"
 
 
 def test_hash_no_messge(mocker):
     """Base case: page doesn't already exist"""
     result = CONTENT_HASH_REGEX.search("[v11dd64d04e0bf92935910a7e73fed39675b1f9a2]")
     assert result is not None
-    assert result.group(1) == "11dd64d04e0bf92935910a7e73fed39675b1f9a2"
+    assert result.group(1) == ""
+    assert result.group(2) == "11dd64d04e0bf92935910a7e73fed39675b1f9a2"
+
+
+def test_hash_blake2b(mocker):
+    result = CONTENT_HASH_REGEX.search(
+        "hello there [vb11dd64d04e0bf92935910a7e73fed39675b1f9a2]"
+    )
+    assert result is not None
+    assert result.group(1) == "b"
+    assert result.group(2) == "11dd64d04e0bf92935910a7e73fed39675b1f9a2"
 
 
 def test_hash_no_hash(mocker):
     """Base case: page doesn't already exist"""
     result = CONTENT_HASH_REGEX.search("hi")
     assert result is None
+
+
+@pytest.mark.parametrize(
+    "message,expected_hash",
+    [
+        (
+            "hello there [vb11dd64d04e0bf92935910a7e73fed39675b1f9a2]",
+            ContentHash(
+                digest="11dd64d04e0bf92935910a7e73fed39675b1f9a2", legacy=False
+            ),
+        ),
+        (
+            "[v11dd64d04e0bf92935910a7e73fed39675b1f9a2]",
+            ContentHash(digest="11dd64d04e0bf92935910a7e73fed39675b1f9a2", legacy=True),
+        ),
+        (
+            "[vb1dd64d04e0bf92935910a7e73fed39675b1f9a2]",
+            ContentHash(digest="b1dd64d04e0bf92935910a7e73fed39675b1f9a2", legacy=True),
+        ),
+        (
+            "hello there [vb11dd64d04e0bf92935910a7e73fed39675b1f9a2]\n",
+            ContentHash(
+                digest="11dd64d04e0bf92935910a7e73fed39675b1f9a2", legacy=False
+            ),
+        ),
+        (
+            "a" * 10000 + " [v11dd64d04e0bf92935910a7e73fed39675b1f9a2]\n",
+            ContentHash(digest="11dd64d04e0bf92935910a7e73fed39675b1f9a2", legacy=True),
+        ),
+        ("[v11dd64d04e0bf92935910a7e73fed39675b1f9a2] and more text", None),
+        ("[v11DD64D04E0BF92935910A7E73FED39675B1F9A2]", None),
+        ("hello there [and general kenobi]", None),
+        ("hi", None),
+        ("", None),
+    ],
+)
+def test_get_content_hash_from_message(message, expected_hash):
+    assert get_content_hash_from_message(message) == expected_hash
+
+
+@pytest.mark.parametrize("message", ["hello there", "", None])
+def test_tag_message_with_hash(message):
+    digest = "11dd64d04e0bf92935910a7e73fed39675b1f9a2"
+    tagged_message = tag_message_with_hash(message, digest)
+
+    assert tagged_message.startswith(message or "[vb")
+    assert get_content_hash_from_message(tagged_message) == ContentHash(
+        digest=digest, legacy=False
+    )
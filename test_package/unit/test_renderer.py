@@ -5,6 +5,13 @@ import pytest
 from md2cf.confluence_renderer import ConfluenceRenderer, ConfluenceTag
 
 
+@pytest.fixture
+def renderer():
+    # Renderers keep the title and attachments of what they rendered, so every test
+    # needs a new one
+    return ConfluenceRenderer()
+
+
 def test_add_namespace():
     assert ConfluenceTag.add_namespace("tagname", "namespace") == "namespace:tagname"
 
@@ -18,104 +25,66 @@ def test_tag_append():
     assert tag.children == [other_tag]
 
 
-def test_tag_render():
-    test_tag_type = "structured-macro"
-    test_tag_markup = "<ac:structured-macro></ac:structured-macro>\n"
-
-    tag = ConfluenceTag(test_tag_type)
-    output = tag.render()
-
-    assert output == test_tag_markup
-
-
-def test_tag_render_with_text():
-    test_tag_type = "structured-macro"
-    test_text_content = "This is some text"
-    test_tag_markup = "<ac:structured-macro>This is some text</ac:structured-macro>\n"
-
-    tag = ConfluenceTag(test_tag_type, text=test_text_content)
-    output = tag.render()
-
-    assert output == test_tag_markup
-
-
-def test_tag_render_with_cdata_text():
-    test_tag_type = "structured-macro"
-    test_text_content = "This is some text\nwith newlines"
-    test_tag_markup = (
-        "<ac:structured-macro>"
-        "<![CDATA[This is some text\nwith newlines]]>"
-        "</ac:structured-macro>\n"
-    )
-
-    tag = ConfluenceTag(test_tag_type, text=test_text_content, cdata=True)
-    output = tag.render()
-
-    assert output == test_tag_markup
-
-
-def test_tag_render_with_attribute():
-    test_tag_type = "structured-macro"
-    test_tag_attrib = {"name": "code"}
-    test_tag_markup = '<ac:structured-macro ac:name="code"></ac:structured-macro>\n'
-
-    tag = ConfluenceTag(test_tag_type, attrib=test_tag_attrib)
+@pytest.mark.parametrize(
+    "kwargs,child_types,expected_markup",
+    [
+        pytest.param(
+            {}, [], "<ac:structured-macro></ac:structured-macro>\n", id="empty"
+        ),
+        pytest.param(
+            {"text": "This is some text"},
+            [],
+            "<ac:structured-macro>This is some text</ac:structured-macro>\n",
+            id="text",
+        ),
+        pytest.param(
+            {"text": "This is some text\nwith newlines", "cdata": True},
+            [],
+            "<ac:structured-macro>"
+            "<![CDATA[This is some text\nwith newlines]]>"
+            "</ac:structured-macro>\n",
+            id="cdata_text",
+        ),
+        pytest.param(
+            {"attrib": {"name": "code"}},
+            [],
+            '<ac:structured-macro ac:name="code"></ac:structured-macro>\n',
+            id="attribute",
+        ),
+        pytest.param(
+            {"attrib": {"name": "code", "foo": "bar"}},
+            [],
+            '<ac:structured-macro ac:foo="bar" ac:name="code"></ac:structured-macro>\n',
+            id="multiple_attributes",
+        ),
+        pytest.param(
+            {},
+            ["unstructured-macro"],
+            "<ac:structured-macro>"
+            "<ac:unstructured-macro>"
+            "</ac:unstructured-macro>\n</ac:structured-macro>\n",
+            id="child",
+        ),
+        pytest.param(
+            {"text": "This is some text"},
+            ["unstructured-macro"],
+            "<ac:structured-macro>"
+            "<ac:unstructured-macro>"
+            "</ac:unstructured-macro>\n"
+            "This is some text</ac:structured-macro>\n",
+            id="child_and_text",
+        ),
+    ],
+)
+def test_tag_render(kwargs, child_types, expected_markup):
+    tag = ConfluenceTag("structured-macro", **kwargs)
+    tag.children = [ConfluenceTag(child_type) for child_type in child_types]
     output = tag.render()
 
-    assert output == test_tag_markup
+    assert output == expected_markup
 
 
-def test_tag_render_with_multiple_attributes():
-    test_tag_type = "structured-macro"
-    test_tag_attrib = {"name": "code", "foo": "bar"}
-    test_tag_markup = (
-        '<ac:structured-macro ac:foo="bar" ac:name="code"></ac:structured-macro>\n'
-    )
-
-    tag = ConfluenceTag(test_tag_type, attrib=test_tag_attrib)
-    output = tag.render()
-
-    assert output == test_tag_markup
-
-
-def test_tag_render_with_child():
-    test_tag_type = "structured-macro"
-    test_other_tag_type = "unstructured-macro"
-    test_tag_markup = (
-        "<ac:structured-macro>"
-        "<ac:unstructured-macro>"
-        "</ac:unstructured-macro>\n</ac:structured-macro>\n"
-    )
-
-    tag = ConfluenceTag(test_tag_type)
-    child_tag = ConfluenceTag(test_other_tag_type)
-    tag.children = [child_tag]
-    output = tag.render()
-
-    assert output == test_tag_markup
-
-
-def test_tag_render_with_child_and_text():
-    test_tag_type = "structured-macro"
-    test_tag_text = "This is some text"
-    test_other_tag_type = "unstructured-macro"
-    test_tag_markup = (
-        "<ac:structured-macro>"
-        "<ac:unstructured-macro>"
-        "</ac:unstructured-macro>\n"
-        "This is some text</ac:structured-macro>\n"
-    )
-
-    tag = ConfluenceTag(test_tag_type, text=test_tag_text)
-    child_tag = ConfluenceTag(test_other_tag_type)
-    tag.children = [child_tag]
-    output = tag.render()
-
-    assert output == test_tag_markup
-
-
-def test_renderer_reinit():
-    renderer = ConfluenceRenderer()
+def test_renderer_reinit(renderer):
     renderer.header("this is a title", 1)
     assert renderer.title is not None
 
@@ -123,7 +92,7 @@ def test_renderer_reinit():
     assert renderer.title is None
 
 
-def test_renderer_block_code():
+def test_renderer_block_code(renderer):
     test_code = "this is a piece of code"
     test_markup = (
         '<ac:structured-macro ac:name="code">'
@@ -132,12 +101,10 @@ def test_renderer_block_code():
         "</ac:structured-macro>\n"
     )
 
-    renderer = ConfluenceRenderer()
-
     assert renderer.block_code(test_code) == test_markup
 
 
-def test_renderer_block_code_with_language():
+def test_renderer_block_code_with_language(renderer):
     test_code = "this is a piece of code"
     test_language = "whitespace"
     test_markup = (
@@ -148,18 +115,31 @@ def test_renderer_block_code_with_language():
         "</ac:structured-macro>\n"
     )
 
-    renderer = ConfluenceRenderer()
-
     assert renderer.block_code(test_code, lang=test_language) == test_markup
 
 
-def test_renderer_header_sets_title():
-    test_header = "this is a header"
-    renderer = ConfluenceRenderer()
-
-    renderer.header(test_header, 1)
-
-    assert renderer.title == test_header
+@pytest.mark.parametrize(
+    "headers,expected_title",
+    [
+        pytest.param([("this is a header", 1)], "this is a header", id="first_level"),
+        pytest.param([("this is a header", 2)], None, id="lower_level"),
+        pytest.param(
+            [("this is a lower header", 2), ("this is a header", 1)],
+            "this is a header",
+            id="later_first_level",
+        ),
+        pytest.param(
+            [("this is a header", 1), ("this is another header", 1)],
+            "this is a header",
+            id="only_first",
+        ),
+    ],
+)
+def test_renderer_header_sets_title(renderer, headers, expected_title):
+    for text, level in headers:
+        renderer.header(text, level)
+
+    assert renderer.title == expected_title
 
 
 def test_renderer_strips_header():
@@ -171,93 +151,53 @@ def test_renderer_strips_header():
     assert result == ""
 
 
-def test_renderer_header_lower_level_does_not_set_title():
-    test_header = "this is a header"
-    renderer = ConfluenceRenderer()
-
-    renderer.header(test_header, 2)
-
-    assert renderer.title is None
-
-
-def test_renderer_header_later_level_sets_title():
-    test_lower_header = "this is a lower header"
-    test_header = "this is a header"
-    renderer = ConfluenceRenderer()
-
-    renderer.header(test_lower_header, 2)
-    renderer.header(test_header, 1)
-
-    assert renderer.title is test_header
-
-
-def test_renderer_header_only_sets_first_title():
-    test_header = "this is a header"
-    test_second_header = "this is another header"
-    renderer = ConfluenceRenderer()
-
-    renderer.header(test_header, 1)
-    renderer.header(test_second_header, 1)
-
-    assert renderer.title is test_header
-
-
-def test_renderer_image_external():
-    test_image_src = "http://example.com/image.jpg"
-    test_image_markup = (
-        '<ac:image ac:alt=""><ri:url ri:value="{}"></ri:url>\n'
-        "</ac:image>\n".format(test_image_src)
-    )
-
-    renderer = ConfluenceRenderer()
-
-    assert renderer.image(test_image_src, "", "") == test_image_markup
-    assert not renderer.attachments
-
-
-def test_renderer_image_external_alt_and_title():
-    test_image_src = "http://example.com/image.jpg"
-    test_image_alt = "alt text"
-    test_image_title = "title"
-    test_image_markup = (
-        '<ac:image ac:alt="{}" ac:title="{}"><ri:url ri:value="{}"></ri:url>\n'
-        "</ac:image>\n".format(test_image_alt, test_image_title, test_image_src)
-    )
-
-    renderer = ConfluenceRenderer()
-
-    assert (
-        renderer.image(test_image_src, test_image_title, test_image_alt)
-        == test_image_markup
-    )
-
-
-def test_renderer_image_internal_absolute():
-    test_image_file = "image.jpg"
-    test_image_src = "/home/test/images/" + test_image_file
-    test_image_markup = (
-        '<ac:image ac:alt=""><ri:attachment ri:filename="{}"></ri:attachment>\n'
-        "</ac:image>\n".format(test_image_file)
-    )
-
-    renderer = ConfluenceRenderer()
-
-    assert renderer.image(test_image_src, "", "") == test_image_markup
-    assert renderer.attachments == [test_image_src]
-
-
-def test_renderer_image_internal_relative():
-    test_image_file = "image.jpg"
-    test_image_src = "test/images/" + test_image_file
-    test_image_markup = (
-        '<ac:image ac:alt=""><ri:attachment ri:filename="{}"></ri:attachment>\n'
-        "</ac:image>\n".format(test_image_file)
-    )
-
-    renderer = ConfluenceRenderer()
-
-    assert renderer.image(test_image_src, "", "") == test_image_markup
-    assert renderer.attachments == [test_image_src]
+@pytest.mark.parametrize(
+    "src,title,alt,expected_markup,expected_attachments",
+    [
+        pytest.param(
+            "http://example.com/image.jpg",
+            "",
+            "",
+            '<ac:image ac:alt=""><ri:url ri:value="http://example.com/image.jpg">'
+            "</ri:url>\n</ac:image>\n",
+            [],
+            id="external",
+        ),
+        pytest.param(
+            "http://example.com/image.jpg",
+            "title",
+            "alt text",
+            '<ac:image ac:alt="alt text" ac:title="title">'
+            '<ri:url ri:value="http://example.com/image.jpg"></ri:url>\n'
+            "</ac:image>\n",
+            [],
+            id="external_alt_and_title",
+        ),
+        pytest.param(
+            "/home/test/images/image.jpg",
+            "",
+            "",
+            '<ac:image ac:alt=""><ri:attachment ri:filename="image.jpg">'
+            "</ri:attachment>\n</ac:image>\n",
+            ["/home/test/images/image.jpg"],
+            id="internal_absolute",
+        ),
+        pytest.param(
+            "test/images/image.jpg",
+            "",
+            "",
+            '<ac:image ac:alt=""><ri:attachment ri:filename="image.jpg">'
+            "</ri:attachment>\n</ac:image>\n",
+            ["test/images/image.jpg"],
+            id="internal_relative",
+        ),
+    ],
+)
+def test_renderer_image(
+    renderer, src, title, alt, expected_markup, expected_attachments
+):
+    assert renderer.image(src, title, alt) == expected_markup
+    assert renderer.attachments == expected_attachments
 
 
 def test_renderer_remove_text_newlines():
@@ -1,14 +1,65 @@
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+
 import pytest
 
+import md2cf.document
 import md2cf.upsert
 from md2cf.api import MinimalConfluence as Confluence
 from md2cf.document import Page
 
+# The body used by most tests, and its content hash tags as they would appear at the
+# end of a version message
+BODY = "hello there"
+BODY_HASH = hashlib.blake2b(BODY.encode(), digest_size=20).hexdigest()
+BODY_HASH_TAG = f"[vb{BODY_HASH}]"
+LEGACY_BODY_HASH_TAG = f"[v{hashlib.sha1(BODY.encode()).hexdigest()}]"
+# A hash tag for content that doesn't match BODY
+OUTDATED_HASH_TAG = "[vdeadbeefc15d32fe2d36c270887df9479c25c640]"
+
+
+@pytest.fixture()
+def confluence(mocker):
+    return mocker.Mock(spec=Confluence)
+
+
+@pytest.fixture()
+def page_factory(mocker):
+    """Build pages with the same space, title and body unless told otherwise"""
+
+    def make_page(**kwargs):
+        page_kwargs = dict(
+            space=mocker.sentinel.space, title=mocker.sentinel.title, body=BODY
+        )
+        page_kwargs.update(kwargs)
+        return Page(**page_kwargs)
+
+    return make_page
+
+
+@pytest.mark.parametrize("use_file_digest", [True, False])
+def test_get_file_hash(tmp_path, monkeypatch, use_file_digest):
+    if not use_file_digest:
+        monkeypatch.delattr(hashlib, "file_digest", raising=False)
+        # Make sure the file is read in multiple chunks
+        monkeypatch.setattr(md2cf.upsert, "FILE_HASH_BUFFER_SIZE", 4096)
+    file_path = tmp_path / "attachment.bin"
+    file_path.write_bytes(b"hello there" * 1000)
+
+    assert (
+        md2cf.upsert.get_file_hash(file_path)
+        == hashlib.blake2b(b"hello there" * 1000, digest_size=20).hexdigest()
+    )
+    assert (
+        md2cf.upsert.get_file_hash(file_path, legacy=True)
+        == hashlib.sha1(b"hello there" * 1000).hexdigest()
+    )
+
 
-def test_upsert_page(mocker):
+def test_upsert_page(mocker, confluence):
     """Base case: page doesn't already exist"""
 
-    confluence = mocker.Mock(spec=Confluence)
     confluence.get_page.return_value = None
     confluence.create_page.return_value = mocker.sentinel.upserted_page
 
@@ -35,13 +86,13 @@ def test_upsert_page(mocker):
         space_key=page.space,
         content_type=page.content_type,
         page_id=None,
-        additional_expansions=[
+        additional_expansions=(
             "space",
             "ancestors",
             "history",
             "version",
             "metadata.labels",
-        ],
+        ),
     )
 
     confluence.create_page.assert_called_once_with(
@@ -57,10 +108,9 @@ def test_upsert_page(mocker):
     confluence.update_page.assert_not_called()
 
 
-def test_upsert_page_get_parent_by_title(mocker):
+def test_upsert_page_get_parent_by_title(mocker, confluence):
     """Base case: page doesn't already exist"""
 
-    confluence = mocker.Mock(spec=Confluence)
     parent_page_mock = mocker.Mock()
     parent_page_mock.id = mocker.sentinel.parent_page_id
     confluence.get_page.side_effect = [None, parent_page_mock]
@@ -95,10 +145,9 @@ def test_upsert_page_get_parent_by_title(mocker):
     assert upsert_result.action == upsert_result.action.CREATED
 
 
-def test_upsert_page_parent_not_found(mocker):
+def test_upsert_page_parent_not_found(mocker, confluence):
     """Base case: page parent doesn't exist"""
 
-    confluence = mocker.Mock(spec=Confluence)
     confluence.get_page.side_effect = [None, None]
 
     page = Page(
@@ -122,22 +171,182 @@ def test_upsert_page_parent_not_found(mocker):
     confluence.create_page.assert_not_called()
 
 
-def test_upsert_page_only_changed_new_page(mocker):
-    """We only want to upload pages that have changed, but this is the first
-    version of the page"""
+def test_get_existing_pages(mocker, confluence):
+    confluence.get_pages.side_effect = [
+        {"one": mocker.sentinel.one},
+        {"post": mocker.sentinel.post},
+    ]
+    pages = [
+        Page(title="one", body="", space="SPACE"),
+        Page(title="two", body="", space="SPACE"),
+        Page(title="by id", body="", space="SPACE", page_id="123"),
+        Page(title="post", body="", space="SPACE", content_type="blogpost"),
+    ]
+
+    existing_pages = md2cf.upsert.get_existing_pages(confluence, pages)
+
+    assert existing_pages == {
+        ("SPACE", "page", "one"): mocker.sentinel.one,
+        ("SPACE", "blogpost", "post"): mocker.sentinel.post,
+    }
+    assert confluence.get_pages.call_args_list == [
+        mocker.call(
+            titles=["one", "two"],
+            space_key="SPACE",
+            content_type="page",
+            additional_expansions=md2cf.upsert.PAGE_EXPANSIONS,
+        ),
+        mocker.call(
+            titles=["post"],
+            space_key="SPACE",
+            content_type="blogpost",
+            additional_expansions=md2cf.upsert.PAGE_EXPANSIONS,
+        ),
+    ]
+
+
+def test_upsert_page_with_existing_pages(mocker, confluence):
+    """Pages that were already looked up in bulk aren't requested again"""
+
+    existing_page_mock = mocker.Mock()
+    parent_page_mock = mocker.Mock()
+    confluence.update_page.return_value = mocker.sentinel.updated_page
+
+    page = Page(
+        space=mocker.sentinel.space,
+        title="title",
+        body=BODY,
+        parent_title="parent",
+    )
+
+    upsert_result = md2cf.upsert.upsert_page(
+        confluence=confluence,
+        page=page,
+        message="",
+        existing_pages={
+            (mocker.sentinel.space, "page", "title"): existing_page_mock,
+            (mocker.sentinel.space, "page", "parent"): parent_page_mock,
+        },
+    )
+
+    confluence.get_page.assert_not_called()
+    confluence.update_page.assert_called_once()
+    assert page.parent_id == parent_page_mock.id
+    assert upsert_result.action == upsert_result.action.UPDATED
+
+
+@pytest.mark.parametrize(
+    "space,content_type",
+    [
+        pytest.param("OTHER", "page", id="other_space"),
+        pytest.param("SPACE", "blogpost", id="other_content_type"),
+    ],
+)
+def test_upsert_page_with_existing_pages_elsewhere(
+    mocker, confluence, space, content_type
+):
+    """Titles are only unique within a space and content type, so pages that were
+    looked up in bulk elsewhere aren't used"""
+
+    confluence.get_page.side_effect = [None, mocker.Mock(id="parent id")]
+    confluence.create_page.return_value = mocker.sentinel.created_page
+
+    page = Page(space="SPACE", title="title", body=BODY, parent_title="parent")
+
+    upsert_result = md2cf.upsert.upsert_page(
+        confluence=confluence,
+        page=page,
+        message="",
+        existing_pages={
+            (space, content_type, "title"): mocker.sentinel.other_page,
+            (space, content_type, "parent"): mocker.sentinel.other_parent,
+        },
+    )
+
+    assert confluence.get_page.call_count == 2
+    assert page.parent_id == "parent id"
+    assert upsert_result.action == upsert_result.action.CREATED
+
+
+def test_upsert_page_drops_updated_page_from_existing_pages(mocker, confluence):
+    """A page that was just updated is removed from the pages looked up in bulk,
+    so another page with the same title doesn't use its outdated version"""
+
+    existing_page_mock = mocker.Mock()
+    confluence.update_page.return_value = mocker.sentinel.updated_page
+    existing_pages = {
+        (mocker.sentinel.space, "page", "title"): existing_page_mock,
+        (mocker.sentinel.space, "page", "other"): mocker.sentinel.other,
+    }
+
+    page = Page(space=mocker.sentinel.space, title="title", body=BODY)
+
+    md2cf.upsert.upsert_page(
+        confluence=confluence, page=page, message="", existing_pages=existing_pages
+    )
+
+    assert existing_pages == {
+        (mocker.sentinel.space, "page", "other"): mocker.sentinel.other
+    }
+
+
+def test_upsert_page_keeps_skipped_page_in_existing_pages(
+    mocker, page_factory, confluence
+):
+    """A page that wasn't changed is still up to date in the pages looked up in
+    bulk"""
+
+    existing_page_mock = make_existing_page(mocker, ["123"], [], BODY_HASH_TAG)
+    existing_pages = {(mocker.sentinel.space, "page", "title"): existing_page_mock}
+
+    page = page_factory(title="title", parent_id="123")
+
+    upsert_result = md2cf.upsert.upsert_page(
+        confluence=confluence,
+        page=page,
+        message="",
+        only_changed=True,
+        existing_pages=existing_pages,
+    )
+
+    assert upsert_result.action == upsert_result.action.SKIPPED
+    assert existing_pages == {
+        (mocker.sentinel.space, "page", "title"): existing_page_mock
+    }
+
+
+def test_upsert_page_missing_from_existing_pages(mocker, confluence):
+    """Search results can be out of date, so pages that weren't found in bulk are
+    still looked up on their own"""
 
-    confluence = mocker.Mock(spec=Confluence)
     confluence.get_page.return_value = None
     confluence.create_page.return_value = mocker.sentinel.created_page
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
+    page = Page(space=mocker.sentinel.space, title="title", body=BODY)
 
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
+    upsert_result = md2cf.upsert.upsert_page(
+        confluence=confluence, page=page, message="", existing_pages={}
     )
 
+    confluence.get_page.assert_called_once_with(
+        title="title",
+        space_key=mocker.sentinel.space,
+        page_id=None,
+        content_type="page",
+        additional_expansions=md2cf.upsert.PAGE_EXPANSIONS,
+    )
+    assert upsert_result.action == upsert_result.action.CREATED
+
+
+def test_upsert_page_only_changed_new_page(mocker, page_factory, confluence):
+    """We only want to upload pages that have changed, but this is the first
+    version of the page"""
+
+    confluence.get_page.return_value = None
+    confluence.create_page.return_value = mocker.sentinel.created_page
+
+    page = page_factory()
+
     upsert_result = md2cf.upsert.upsert_page(
         confluence=confluence, page=page, message="", only_changed=True
     )
@@ -148,7 +357,7 @@ def test_upsert_page_only_changed_new_page(mocker):
         body=page.body,
         content_type=page.content_type,
         parent_id=None,
-        update_message=message_hash,
+        update_message=BODY_HASH_TAG,
         labels=None,
     )
 
@@ -156,25 +365,17 @@ def test_upsert_page_only_changed_new_page(mocker):
     assert upsert_result.action == upsert_result.action.CREATED
 
 
-def test_upsert_page_only_changed_modified_page(mocker):
+def test_upsert_page_only_changed_modified_page(mocker, page_factory, confluence):
     """We only want to upload pages that have changed, and the existing page
     has been changed"""
 
-    confluence = mocker.Mock(spec=Confluence)
-    original_message_hash = "[vdeadbeefc15d32fe2d36c270887df9479c25c640]"
     existing_page_mock = mocker.Mock()
-    existing_page_mock.version.message = original_message_hash
+    existing_page_mock.version.message = OUTDATED_HASH_TAG
     existing_page_mock.ancestors = [mocker.Mock()]
     confluence.get_page.side_effect = [existing_page_mock, None]
     confluence.update_page.return_value = mocker.sentinel.updated_page
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-    )
+    page = page_factory()
 
     upsert_result = md2cf.upsert.upsert_page(
         confluence=confluence, page=page, message="", only_changed=True
@@ -185,7 +386,7 @@ def test_upsert_page_only_changed_modified_page(mocker):
         body=page.body,
         minor_edit=False,
         parent_id=None,
-        update_message=message_hash,
+        update_message=BODY_HASH_TAG,
         labels=None,
     )
 
@@ -193,277 +394,351 @@ def test_upsert_page_only_changed_modified_page(mocker):
     assert upsert_result.action == upsert_result.action.UPDATED
 
 
-def test_upsert_page_only_changed_no_changes(mocker):
-    """We only want to upload pages that have changed, but the existing page
-    has NOT been changed"""
+def test_upsert_page_adds_missing_labels(mocker, page_factory, confluence):
+    """Missing labels are found on the page as it was fetched, since the updated
+    page returned by Confluence doesn't include them"""
 
-    confluence = mocker.Mock(spec=Confluence)
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
     existing_page_mock = mocker.Mock()
-    existing_page_mock.version.message = message_hash
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    confluence.get_page.side_effect = [existing_page_mock, None]
+    existing_page_mock.metadata.labels.results = []
+    confluence.get_page.return_value = existing_page_mock
     confluence.update_page.return_value = mocker.sentinel.updated_page
 
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        parent_id=mocker.sentinel.parent_id,
-    )
-
-    upsert_result = md2cf.upsert.upsert_page(
-        confluence=confluence, page=page, message="", only_changed=True
+    page = page_factory(
+        labels=["label1"],
     )
 
-    confluence.update_page.assert_not_called()
+    md2cf.upsert.upsert_page(confluence=confluence, page=page, message="")
 
-    assert upsert_result.response == existing_page_mock
-    assert upsert_result.action == upsert_result.action.SKIPPED
+    confluence.add_labels.assert_called_once_with(
+        page=mocker.sentinel.updated_page, labels=["label1"]
+    )
 
 
-def test_page_needs_updating_page_not_changed(mocker):
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
+def test_upsert_page_replace_all_labels_does_not_add_labels(
+    mocker, page_factory, confluence
+):
     existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
+    existing_page_mock.metadata.labels.results = []
+    confluence.get_page.return_value = existing_page_mock
 
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        parent_id=mocker.sentinel.parent_id,
+    page = page_factory(
+        labels=["label1"],
     )
 
-    assert not md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=False
+    md2cf.upsert.upsert_page(
+        confluence=confluence, page=page, message="", replace_all_labels=True
     )
 
+    assert confluence.update_page.call_args[1]["labels"] == ["label1"]
+    confluence.add_labels.assert_not_called()
+
+
+def test_upsert_page_only_changed_no_changes(mocker, page_factory, confluence):
+    """We only want to upload pages that have changed, but the existing page
+    has NOT been changed"""
 
-def test_page_needs_updating_page_changed(mocker):
-    message_hash = "[vdeadbeefc15d32fe2d36c270887df9479c25c640]"
     existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
+    existing_page_mock.version.message = LEGACY_BODY_HASH_TAG
+    existing_page_mock.ancestors = [SimpleNamespace(id=mocker.sentinel.parent_id)]
+    confluence.get_page.side_effect = [existing_page_mock, None]
+    confluence.update_page.return_value = mocker.sentinel.updated_page
 
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
+    page = page_factory(
         parent_id=mocker.sentinel.parent_id,
     )
 
-    assert md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=False
-    )
-
-
-def test_page_needs_updating_content_replace_all_labels_and_labels_not_changed(mocker):
-    """We want to replace all the labels, but they have not changed"""
-    labels = ["label1", "label2"]
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        labels=labels,
-        parent_id=mocker.sentinel.parent_id,
+    upsert_result = md2cf.upsert.upsert_page(
+        confluence=confluence, page=page, message="", only_changed=True
     )
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-    existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
-    existing_page_mock.metadata.labels.results = []
-    for label in labels:
-        label_mock = mocker.Mock()
-        label_mock.name = label
-        existing_page_mock.metadata.labels.results.append(label_mock)
+    confluence.update_page.assert_not_called()
 
-    assert not md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
-    )
+    assert upsert_result.response == existing_page_mock
+    assert upsert_result.action == upsert_result.action.SKIPPED
 
 
-def test_page_needs_updating_from_top_page_to_another_parent(mocker):
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        parent_id="123",
-    )
+def test_upsert_page_only_changed_no_changes_legacy_hash_only(
+    mocker, page_factory, confluence
+):
+    """A page that hasn't changed since it was uploaded with a legacy hash only
+    needs its legacy hash computed"""
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
     existing_page_mock = mocker.Mock()
-    existing_page_mock.ancestors = []
-    existing_page_mock.version.message = message_hash
-    existing_page_mock.metadata.labels.results = []
+    existing_page_mock.version.message = LEGACY_BODY_HASH_TAG
+    existing_page_mock.ancestors = [SimpleNamespace(id=mocker.sentinel.parent_id)]
+    confluence.get_page.return_value = existing_page_mock
+    new_content_hash_spy = mocker.spy(md2cf.document, "new_content_hash")
 
-    assert md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
+    page = page_factory(
+        parent_id=mocker.sentinel.parent_id,
     )
 
-
-def test_page_needs_updating_from_child_page_to_top_page(mocker):
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        parent_id=None,
+    upsert_result = md2cf.upsert.upsert_page(
+        confluence=confluence, page=page, message="", only_changed=True
     )
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-    existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = "123"
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
-    existing_page_mock.metadata.labels.results = []
+    assert upsert_result.action == upsert_result.action.SKIPPED
+    new_content_hash_spy.assert_called_once_with(legacy=True)
 
-    assert md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
-    )
 
+@pytest.mark.parametrize(
+    "message,only_changed,expected",
+    [
+        ("a message", False, "a message"),
+        ("", True, BODY_HASH_TAG),
+        ("a message", True, f"a message {BODY_HASH_TAG}"),
+    ],
+)
+def test_get_page_message(message, only_changed, expected):
+    page = Page(title="title", body=BODY)
+
+    assert md2cf.upsert.get_page_message(page, message, only_changed) == expected
 
-def test_page_needs_updating_from_grandchild_page_to_top_page(mocker):
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        parent_id=None,
-    )
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
+def make_existing_page(mocker, ancestor_ids, labels, message):
     existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = "123"
-    other_ancestor_mock = mocker.Mock()
-    other_ancestor_mock.id = "567"
-    existing_page_mock.ancestors = [ancestor_mock, other_ancestor_mock]
-    existing_page_mock.version.message = message_hash
-    existing_page_mock.metadata.labels.results = []
+    # The code under test only reads these attributes, so they don't need to be
+    # full mocks
+    existing_page_mock.ancestors = [
+        SimpleNamespace(id=ancestor_id) for ancestor_id in ancestor_ids
+    ]
+    existing_page_mock.version.message = message
+    existing_page_mock.metadata.labels.results = [
+        SimpleNamespace(name=label) for label in labels
+    ]
+    return existing_page_mock
+
+
+@pytest.mark.parametrize(
+    "parent_id,labels,ancestor_ids,existing_labels,message,replace_all_labels,"
+    "expected",
+    [
+        pytest.param(
+            "123", None, ["123"], [], BODY_HASH_TAG, False, False, id="not_changed"
+        ),
+        # Pages uploaded by older versions of md2cf have SHA-1 hashes, which should
+        # still be recognized
+        pytest.param(
+            "123",
+            None,
+            ["123"],
+            [],
+            LEGACY_BODY_HASH_TAG,
+            False,
+            False,
+            id="legacy_hash_not_changed",
+        ),
+        pytest.param(
+            "123",
+            None,
+            ["123"],
+            [],
+            OUTDATED_HASH_TAG,
+            False,
+            True,
+            id="changed",
+        ),
+        pytest.param(
+            "123",
+            ["label1", "label2"],
+            ["123"],
+            ["label1", "label2"],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            False,
+            id="replace_all_labels_and_labels_not_changed",
+        ),
+        pytest.param(
+            "123",
+            None,
+            [],
+            [],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            True,
+            id="from_top_page_to_another_parent",
+        ),
+        pytest.param(
+            None,
+            None,
+            ["123"],
+            [],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            True,
+            id="from_child_page_to_top_page",
+        ),
+        pytest.param(
+            None,
+            None,
+            ["123", "567"],
+            [],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            True,
+            id="from_grandchild_page_to_top_page",
+        ),
+        pytest.param(
+            None,
+            ["label1", "label2"],
+            ["456"],
+            ["label2", "label3"],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            True,
+            id="replace_all_labels_and_labels_changed",
+        ),
+        pytest.param(
+            "123",
+            None,
+            ["123"],
+            ["label1", "label2"],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            False,
+            id="replace_all_labels_but_no_labels_supplied",
+        ),
+        # An empty list of labels should remove all labels if the page has any
+        pytest.param(
+            "123",
+            [],
+            ["123"],
+            ["label1", "label2"],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            True,
+            id="replace_all_labels_and_empty_labels_supplied",
+        ),
+        pytest.param(
+            "123",
+            [],
+            ["123"],
+            [],
+            LEGACY_BODY_HASH_TAG,
+            True,
+            False,
+            id="replace_all_labels_and_empty_labels_supplied_not_changed",
+        ),
+    ],
+)
+def test_page_needs_updating(
+    mocker,
+    page_factory,
+    parent_id,
+    labels,
+    ancestor_ids,
+    existing_labels,
+    message,
+    replace_all_labels,
+    expected,
+):
+    page = page_factory(
+        labels=labels,
+        parent_id=parent_id,
+    )
+    existing_page_mock = make_existing_page(
+        mocker, ancestor_ids, existing_labels, message
+    )
 
-    assert md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
+    assert (
+        md2cf.upsert.page_needs_updating(
+            page, existing_page_mock, replace_all_labels=replace_all_labels
+        )
+        == expected
     )
 
 
-def test_page_needs_updating_content_replace_all_labels_and_labels_changed(mocker):
-    """We want to replace all the labels, and they have changed"""
-    page_labels = ["label1", "label2"]
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        labels=page_labels,
-    )
+@pytest.mark.parametrize(
+    "existing_labels,labels,expected",
+    [
+        (["label1", "label2"], ["label2", "label1"], False),
+        (["label1", "label2"], ["label1"], True),
+        ([], ["label1"], True),
+        (["label1"], None, False),
+        (["label1"], ["label2"], True),
+        (["label1"], ["label1", "label1"], False),
+    ],
+)
+def test_labels_need_updating(mocker, existing_labels, labels, expected):
+    page = Page(title=mocker.sentinel.title, body=BODY, labels=labels)
+    existing_page_mock = make_existing_page(mocker, [], existing_labels, "")
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-    existing_page_mock = mocker.Mock()
-    existing_page_mock.ancestors = [mocker.Mock()]
-    existing_page_mock.version.message = message_hash
-    existing_page_mock.metadata.labels.results = []
-    existing_page_labels = ["label2", "label3"]
-    for label in existing_page_labels:
-        label_mock = mocker.Mock()
-        label_mock.name = label
-        existing_page_mock.metadata.labels.results.append(label_mock)
+    assert md2cf.upsert.labels_need_updating(page, existing_page_mock) == expected
 
-    assert md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
-    )
 
+def test_upsert_attachment_with_existing_attachments(mocker, confluence, tmp_path):
+    """Attachments that were already listed for the page aren't looked up again"""
+    (tmp_path / "image.png").write_bytes(BODY.encode())
+    existing_attachment_mock = mocker.Mock()
+    existing_attachment_mock.version.message = BODY_HASH_TAG
+    page = Page(title="title", body="", file_path=tmp_path / "page.md")
 
-def test_page_needs_updating_content_replace_all_labels_but_no_labels_supplied(mocker):
-    """We want to replace all the labels, but none were supplied"""
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        labels=None,
-        parent_id=mocker.sentinel.parent_id,
+    upsert_result = md2cf.upsert.upsert_attachment(
+        confluence=confluence,
+        attachment=Path("image.png"),
+        existing_page=mocker.sentinel.existing_page,
+        message="",
+        only_changed=True,
+        page=page,
+        existing_attachments={"image.png": existing_attachment_mock},
     )
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-    existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
-
-    labels = ["label1", "label2"]
-    existing_page_mock.metadata.labels.results = []
-    for label in labels:
-        label_mock = mocker.Mock()
-        label_mock.name = label
-        existing_page_mock.metadata.labels.results.append(label_mock)
+    confluence.get_attachment.assert_not_called()
+    confluence.update_attachment.assert_not_called()
+    assert upsert_result.action == upsert_result.action.SKIPPED
 
-    assert not md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
-    )
 
+def test_upsert_attachment_not_changed_legacy_hash(mocker, confluence, tmp_path):
+    """An attachment that hasn't changed since it was uploaded with a legacy hash
+    only needs its legacy hash computed"""
+    (tmp_path / "image.png").write_bytes(BODY.encode())
+    existing_attachment_mock = mocker.Mock()
+    existing_attachment_mock.version.message = LEGACY_BODY_HASH_TAG
+    confluence.get_attachment.return_value = existing_attachment_mock
+    new_content_hash_spy = mocker.spy(md2cf.document, "new_content_hash")
+    page = Page(title="title", body="", file_path=tmp_path / "page.md")
 
-def test_page_needs_updating_content_replace_all_labels_and_empty_labels_supplied(
-    mocker,
-):
-    """We want to replace all the labels, and an empty list was supplied:
-    should update to remove all labels if the list is different"""
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        labels=[],
-        parent_id=mocker.sentinel.parent_id,
+    upsert_result = md2cf.upsert.upsert_attachment(
+        confluence=confluence,
+        attachment=Path("image.png"),
+        existing_page=mocker.sentinel.existing_page,
+        message="",
+        only_changed=True,
+        page=page,
     )
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-    existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
+    assert upsert_result.action == upsert_result.action.SKIPPED
+    confluence.update_attachment.assert_not_called()
+    new_content_hash_spy.assert_called_once_with(legacy=True)
 
-    labels = ["label1", "label2"]
-    existing_page_mock.metadata.labels.results = []
-    for label in labels:
-        label_mock = mocker.Mock()
-        label_mock.name = label
-        existing_page_mock.metadata.labels.results.append(label_mock)
 
-    assert md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
+def test_upsert_attachment_changed_legacy_hash(mocker, confluence, tmp_path):
+    """The attachment is hashed twice and then uploaded from the same file"""
+    (tmp_path / "image.png").write_bytes(BODY.encode())
+    existing_attachment_mock = mocker.Mock()
+    existing_attachment_mock.version.message = (
+        "[v0000000000000000000000000000000000000000]"
     )
-
-
-def test_page_needs_updating_content_replace_all_labels_and_empty_labels_supplied_not_changed(  # noqa: E501
-    mocker,
-):
-    """We want to replace all the labels, and an empty list was supplied:
-    should not update because the page already has no labels"""
-    page = Page(
-        space=mocker.sentinel.space,
-        title=mocker.sentinel.title,
-        body="hello there",
-        labels=[],
-        parent_id=mocker.sentinel.parent_id,
+    confluence.get_attachment.return_value = existing_attachment_mock
+    uploaded_contents = []
+    confluence.update_attachment.side_effect = (
+        lambda fp, **kwargs: uploaded_contents.append(fp.read())
+        or mocker.sentinel.updated_attachment
     )
+    open_spy = mocker.spy(Path, "open")
+    page = Page(title="title", body="", file_path=tmp_path / "page.md")
 
-    message_hash = "[v6e71b3cac15d32fe2d36c270887df9479c25c640]"
-    existing_page_mock = mocker.Mock()
-    ancestor_mock = mocker.Mock()
-    ancestor_mock.id = mocker.sentinel.parent_id
-    existing_page_mock.ancestors = [ancestor_mock]
-    existing_page_mock.version.message = message_hash
-
-    existing_page_mock.metadata.labels.results = []
-
-    assert not md2cf.upsert.page_needs_updating(
-        page, existing_page_mock, replace_all_labels=True
+    upsert_result = md2cf.upsert.upsert_attachment(
+        confluence=confluence,
+        attachment=Path("image.png"),
+        existing_page=mocker.sentinel.existing_page,
+        message="",
+        only_changed=True,
+        page=page,
     )
+
+    assert upsert_result.action == upsert_result.action.UPDATED
+    assert upsert_result.response == mocker.sentinel.updated_attachment
+    assert uploaded_contents == [BODY.encode()]
+    assert confluence.update_attachment.call_args[1]["message"] == BODY_HASH_TAG
+    open_spy.assert_called_once()
@@ -1,37 +1,53 @@
+import operator
+
+FAKE_PAGE_PARAMETERS = (
+    "title",
+    "body",
+    "attachments",
+    "file_path",
+    "page_id",
+    "parent_id",
+    "parent_title",
+    "space",
+    "labels",
+    "relative_links",
+)
+
+
 class FakePage(object):
     """Assert helper that compares specified Page parameters."""
 
+    __slots__ = ("attrs_to_compare", "_expected_values", "_get_actual_values")
+
     def __init__(self, **kwargs):
-        self.attrs_to_compare = dict()
-        for parameter in [
-            "title",
-            "body",
-            "attachments",
-            "file_path",
-            "page_id",
-            "parent_id",
-            "parent_title",
-            "space",
-            "labels",
-            "relative_links",
-        ]:
-            param_value = kwargs.get(parameter, None)
-            if param_value:
-                self.attrs_to_compare[parameter] = param_value
+        self.attrs_to_compare = {
+            parameter: kwargs[parameter]
+            for parameter in FAKE_PAGE_PARAMETERS
+            if kwargs.get(parameter) is not None
+        }
+
+        # Fetch all the attributes of the actual page in one call when comparing.
+        # attrgetter returns a bare value instead of a tuple for a single attribute.
+        expected_values = tuple(self.attrs_to_compare.values())
+        if len(expected_values) == 1:
+            expected_values = expected_values[0]
+        self._expected_values = expected_values
+        self._get_actual_values = (
+            operator.attrgetter(*self.attrs_to_compare)
+            if self.attrs_to_compare
+            else None
+        )
 
     def __eq__(self, actual):
-        for attribute_name, attribute_value in self.attrs_to_compare.items():
-            actual_attribute = getattr(actual, attribute_name, None)
-            if actual_attribute != attribute_value:
-                return False
-        return True
+        if self._get_actual_values is None:
+            return True
+        try:
+            return self._get_actual_values(actual) == self._expected_values
+        except AttributeError:
+            return False
 
     def __repr__(self):
-        return "FakePage({})".format(
-            ", ".join(
-                [
-                    "{}={}".format(name, repr(value))
-                    for name, value in self.attrs_to_compare.items()
-                ]
-            )
+        attributes = ", ".join(
+            f"{name}={value!r}" for name, value in self.attrs_to_compare.items()
         )
+        return f"FakePage({attributes})"